@@ -0,0 +1,202 @@
+# Benchmarks for server_final.py against a synthetic JMeter sample database.
+#
+#   python bench.py aggregate --rows 10000000
+#   python bench.py label_tps --rows 10000000 --labels 150
+#   python bench.py layout --rows 2000000 --tests 4
+#
+# The database is generated once and reused (--db), so repeated runs only pay for
+# the measured code. Redirect to bench_output.txt to keep the numbers.
+import argparse, concurrent.futures, glob, os, random, sqlite3, time
+import server_final as sf
+
+def build_db(path, rows, labels, test_id, seed=7):
+    if os.path.exists(path):
+        conn = sqlite3.connect(path)
+        have = conn.execute("SELECT COUNT(*) FROM jmeter_samples WHERE test_id=?", (test_id,)).fetchone()[0]
+        conn.close()
+        if have >= rows:
+            print(f"reusing {path} ({have:,} rows)")
+            return
+        os.remove(path)
+    print(f"generating {rows:,} rows into {path} ...")
+    sf.DB_FILE = path
+    sf.init_db()
+    sf.db_pool().close()
+    rnd = random.Random(seed)
+    names = [f"Transaction_{i:03d}" for i in range(labels)]
+    t0 = 1700000000
+    per_sec = max(1, rows // 3600)
+    conn = sqlite3.connect(path)
+    chunk = 200000
+    for lo in range(0, rows, chunk):
+        batch = []
+        for i in range(lo, min(rows, lo + chunk)):
+            ok = rnd.random() > 0.02
+            batch.append((t0 + i // per_sec, rnd.choice(names), float(int(rnd.lognormvariate(5.5, 0.8))),
+                          1 if ok else 0, 200, 200 if ok else 500, None if ok else "Internal Server Error",
+                          rnd.randint(500, 20000), rnd.randint(100, 900), test_id))
+        conn.executemany(sf.INSERT_SAMPLE_SQL, batch)
+        conn.commit()
+    conn.close()
+
+def timed(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        out = fn()
+        elapsed = time.perf_counter() - t
+        best = elapsed if best is None else min(best, elapsed)
+    return best, out
+
+def bench_aggregate(args):
+    build_db(args.db, args.rows, args.labels, args.test_id)
+    sf.DB_FILE = args.db
+    q = ("SELECT label, response_time, success, received_bytes, sent_bytes, timestamp "
+         "FROM jmeter_samples WHERE test_id = ?")
+    fetch, rows = timed(lambda: sf.run_query(q, (args.test_id,)), args.repeat)
+    print(f"fetch only ({len(rows):,} rows): {fetch:8.2f}s")
+    if sf.np is None:
+        print("numpy is not installed, only the python engine can run")
+        return
+    py_t, py_out = timed(lambda: sf.aggregate_exact(args.test_id, None, None, "python"), args.repeat)
+    np_t, np_out = timed(lambda: sf.aggregate_exact(args.test_id, None, None, "numpy"), args.repeat)
+    print(f"api_aggregate python engine: {py_t:8.2f}s  (compute ~{py_t - fetch:.2f}s)")
+    print(f"api_aggregate numpy engine:  {np_t:8.2f}s  (compute ~{np_t - fetch:.2f}s)")
+    print(f"speedup end-to-end {py_t / np_t:.2f}x, compute {(py_t - fetch) / max(np_t - fetch, 1e-9):.2f}x")
+    print("identical output:", py_out == np_out)
+
+def label_tps_per_label(db, test_id, start, end):
+    # the previous api_label_tps: DISTINCT label, then one GROUP BY timestamp
+    # query per label fanned out on a thread pool, each on its own connection
+    def run(q, params):
+        conn = sqlite3.connect(db)
+        rows = conn.execute(q, params).fetchall()
+        conn.close()
+        return rows
+    labels = [r[0] for r in run("SELECT DISTINCT label FROM jmeter_samples "
+                                "WHERE timestamp BETWEEN ? AND ? AND test_id=?", (start, end, test_id))]
+    def one(label):
+        rows = run("SELECT timestamp, COUNT(*) FROM jmeter_samples "
+                   "WHERE timestamp BETWEEN ? AND ? AND label=? AND test_id=? "
+                   "GROUP BY timestamp ORDER BY timestamp ASC", (start, end, label, test_id))
+        ts_map = {r[0]: float(r[1]) for r in rows}
+        return label, [round(ts_map.get(sec, 0.0), 2) for sec in range(start, end + 1)]
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        return dict(executor.map(one, labels))
+
+def bench_label_tps(args):
+    import server_final_2 as sf2
+    build_db(args.db, args.rows, args.labels, args.test_id)
+    sf.DB_FILE = sf2.DB_FILE = args.db
+    sf.init_db()   # backfills the rollup tiers on first use
+    start, end = sf.run_query("SELECT MIN(timestamp), MAX(timestamp) FROM jmeter_samples WHERE test_id=?",
+                              (args.test_id,))[0]
+    start, end = int(start), int(end)
+    query = f"?test_id={args.test_id}&end={end}&window={end - start + 1}"
+    # serve the old implementation through the same app so JSON encoding is timed too
+    sf2.app.add_url_rule("/bench/label_tps_old", "bench_label_tps_old", lambda: sf2.jsonify({
+        "timestamps": list(range(start, end + 1)),
+        "label_tps": label_tps_per_label(args.db, args.test_id, start, end)}))
+    c2, c1 = sf2.app.test_client(), sf.app.test_client()
+    old_t, old_out = timed(lambda: c2.get("/bench/label_tps_old" + query).get_json(), args.repeat)
+    new_t, new_out = timed(lambda: c2.get("/api/label_tps" + query).get_json(), args.repeat)
+    roll_t, roll_out = timed(lambda: c1.get("/api/label_tps" + query).get_json(), args.repeat)
+    print(f"window {end - start + 1}s, {len(old_out['label_tps'])} labels")
+    print(f"per-label queries (old):      {old_t:8.2f}s  ({len(old_out['label_tps']) + 1} queries)")
+    print(f"single GROUP BY, raw table:   {new_t:8.2f}s  ({old_t / new_t:.1f}x)")
+    print(f"single GROUP BY, rollups:     {roll_t:8.2f}s  ({old_t / roll_t:.1f}x, {roll_out['resolution']}s buckets)")
+    print("identical output:", old_out == new_out)
+
+def synthetic_rows(rows, labels, test_ids, seed=7):
+    # test_ids run concurrently, so their samples interleave in arrival order
+    rnd = random.Random(seed)
+    names = [f"Transaction_{i:03d}" for i in range(labels)]
+    t0 = 1700000000
+    per_sec = max(1, rows // 3600)
+    out = []
+    for i in range(rows):
+        ok = rnd.random() > 0.02
+        out.append((t0 + i // per_sec, rnd.choice(names), float(int(rnd.lognormvariate(5.5, 0.8))),
+                    1 if ok else 0, 200, 200 if ok else 500, None if ok else "Internal Server Error",
+                    rnd.randint(500, 20000), rnd.randint(100, 900), test_ids[i % len(test_ids)]))
+    return out
+
+def sample_bytes(path):
+    conn = sqlite3.connect(path)
+    rows = conn.execute("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name").fetchall()
+    conn.close()
+    return sum(size for name, size in rows
+               if name.startswith(("sample_data", "idx_sample_")) and "rollup" not in name)
+
+def bench_layout(args):
+    # the same sample stream is ingested through write_samples into a fresh
+    # database per layout, then the raw-table reads behind the dashboard and the
+    # deletion of one test are timed
+    test_ids = [f"{args.test_id}_{i}" for i in range(args.tests)]
+    rows = synthetic_rows(args.rows, args.labels, test_ids)
+    sf.TEST_IDLE_FINALIZE = 0
+    engine = "numpy" if sf.np is not None else "python"
+    test_id = test_ids[0]
+    stem = os.path.splitext(args.db)[0]
+    results = {}
+    for layout in sf.SAMPLE_LAYOUTS:
+        path = f"{stem}_{layout}.db"
+        for f in glob.glob(path + "*"):
+            os.remove(f)
+        sf.SAMPLE_LAYOUT, sf.DB_FILE = layout, path
+        sf.init_db()
+        t = time.perf_counter()
+        for lo in range(0, len(rows), sf.INGEST_BATCH_SIZE):
+            sf.write_samples(rows[lo:lo + sf.INGEST_BATCH_SIZE])
+        ingest = time.perf_counter() - t
+        source = sf.sample_source(test_id)   # the test's own view when partitioned
+        lo_ts, hi_ts = sf.run_query(f"SELECT MIN(timestamp), MAX(timestamp) FROM {source} WHERE test_id=?",
+                                    (test_id,))[0]
+        mid = (lo_ts + hi_ts) // 2
+        last_id = sf.run_query(f"SELECT MAX(id) FROM {source} WHERE test_id=?", (test_id,))[0][0]
+        queries = {
+            "aggregate, whole test": lambda: sf.aggregate_exact(test_id, None, None, engine),
+            "aggregate, 10 min window": lambda: sf.aggregate_exact(test_id, mid - 300, mid + 299, engine),
+            "errors table": lambda: sf.errors_table(test_id, None, None),
+            "live tail (id > watermark)": lambda: sf.run_query(
+                "SELECT id, label, response_time, success, received_bytes, sent_bytes, timestamp "
+                f"FROM {source} WHERE test_id = ? AND id > ? ORDER BY id", (test_id, last_id - 5000)),
+        }
+        timings = {name: timed(fn, args.repeat) for name, fn in queries.items()}
+        size = sample_bytes(path)
+        # the endpoint answers 202 at once; the background job is timed to the end,
+        # and must be done before DB_FILE moves on to the next layout
+        client = sf.app.test_client()
+        t = time.perf_counter()
+        status_url = client.post("/api/delete_testid", json={"test_id": test_ids[-1]}).get_json()["status_url"]
+        job = client.get(status_url).get_json()
+        while job["status"] not in ("done", "failed"):
+            time.sleep(0.01)
+            job = client.get(status_url).get_json()
+        delete = time.perf_counter() - t
+        if job["status"] == "failed":
+            raise RuntimeError(f"delete job failed: {job['error']}")
+        sf.db_pool().close()
+        results[layout] = (ingest, size, timings, delete)
+    print(f"{args.rows:,} rows, {args.tests} interleaved tests, {args.labels} labels, queries on {test_id}")
+    print(f"{'':28}" + "".join(f"{layout:>14}" for layout in results))
+    print(f"{'ingest (write_samples)':28}" + "".join(f"{r[0]:13.2f}s" for r in results.values()))
+    print(f"{'samples + indexes':28}" + "".join(f"{r[1] / 1e6:12.1f}MB" for r in results.values()))
+    for name in queries:
+        print(f"{name:28}" + "".join(f"{r[2][name][0]:13.3f}s" for r in results.values()))
+    print(f"{'delete_testid, one test':28}" + "".join(f"{r[3]:13.3f}s" for r in results.values()))
+    # rows come back in each layout's scan order, so labels may be listed differently
+    outputs = [{name: sorted(map(str, out)) for name, (_, out) in r[2].items()} for r in results.values()]
+    print("identical output:", all(o == outputs[0] for o in outputs))
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("bench", choices=["aggregate", "label_tps", "layout"])
+    ap.add_argument("--db", default="bench_metrics.db")
+    ap.add_argument("--rows", type=int, default=10_000_000)
+    ap.add_argument("--labels", type=int, default=50)
+    ap.add_argument("--test-id", default="bench")
+    ap.add_argument("--tests", type=int, default=4, help="concurrent tests (layout only)")
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+    {"aggregate": bench_aggregate, "label_tps": bench_label_tps, "layout": bench_layout}[args.bench](args)
@@ -0,0 +1,40 @@
+# Converts the sample storage of a metrics database between the "rowid",
+# "clustered" and "partitioned" layouts (see SAMPLE_LAYOUTS in server_final.py).
+# Stop the server first; the file is rewritten and vacuumed in place.
+#
+#   python migrate_layout.py jmeter_metrics_15SEP30.db --to clustered
+#   python migrate_layout.py jmeter_metrics_15SEP30.db --to partitioned
+import argparse, os, sqlite3, time
+import server_final as sf
+
+def table_bytes(path):
+    conn = sqlite3.connect(path)
+    try:
+        rows = conn.execute("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name").fetchall()
+    except sqlite3.OperationalError:   # SQLite built without dbstat
+        rows = []
+    conn.close()
+    return sum(size for name, size in rows
+               if name.startswith(("sample_data", "idx_sample_")) and "rollup" not in name)
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("db")
+    ap.add_argument("--to", choices=sf.SAMPLE_LAYOUTS, required=True)
+    args = ap.parse_args()
+    if not os.path.exists(args.db):
+        ap.error(f"{args.db} does not exist")
+    sf.DB_FILE = args.db
+    with sf.db_pool().writer() as conn:
+        sf.create_schema(conn)   # brings older files up to the current schema first
+        before = sf.sample_layout(conn)
+        size = table_bytes(args.db)
+        t = time.perf_counter()
+        changed = sf.convert_sample_layout(conn, args.to)
+        elapsed = time.perf_counter() - t
+    sf.db_pool().close()
+    if not changed:
+        print(f"{args.db} already uses the {args.to} layout")
+    else:
+        print(f"{args.db}: {before} -> {args.to} in {elapsed:.1f}s, "
+              f"samples and indexes {size / 1e6:.1f}MB -> {table_bytes(args.db) / 1e6:.1f}MB")
@@ -1,11 +1,18 @@
 #graphs fixed and tps fixed
 
 # jmeter_dashboard.py copy 1
-from flask import Flask, request, jsonify, render_template_string, send_file, make_response
+from flask import Flask, request, jsonify, render_template_string, send_file, make_response, Response, stream_with_context
 import sqlite3, time, statistics, csv, io, json
 from datetime import datetime, timedelta
 import math
 import glob, os
+import threading, collections, atexit, functools, hashlib
+from array import array
+from contextlib import contextmanager
+try:
+    import numpy as np
+except ImportError:  # the vectorized aggregate engine is optional
+    np = None
 app = Flask(__name__)
 date_str = datetime.now().strftime("%d%b%M").upper()
 DB_FILE = f"jmeter_metrics_{date_str}.db"
@@ -32,68 +39,719 @@ def jmeter_median(data):
     rank = math.ceil(n / 2)
     return data_sorted[rank - 1]
 
+# --------- SQLite connection pool ----------
+DB_BUSY_TIMEOUT = 30          # seconds a connection waits on a locked database
+DB_CACHE_SIZE_KB = 65536      # page cache per connection (PRAGMA cache_size = -KB)
+DB_MMAP_SIZE = 268435456      # bytes of the file memory-mapped per connection
+POOL_MAX_IDLE_READERS = 16
+
+class ConnectionPool:
+    """Warm SQLite connections for one database file.
+
+    Readers are checked out from a LIFO stack of query_only connections; all
+    writes go through a single long-lived writer connection guarded by a lock.
+    Pragmas are applied once, when a connection is opened.
+    """
+
+    def __init__(self, db_file, max_idle_readers=POOL_MAX_IDLE_READERS):
+        self.db_file = db_file
+        self.max_idle_readers = max_idle_readers
+        self._idle = []
+        self._lock = threading.Lock()
+        self._writer = None
+        self.write_lock = threading.RLock()
+        self.stats = {"readers_opened": 0, "readers_closed": 0, "reader_checkouts": 0,
+                      "reader_reuses": 0, "readers_in_use": 0, "writer_opened": 0,
+                      "writer_checkouts": 0}
+
+    def _connect(self, readonly):
+        conn = sqlite3.connect(self.db_file, timeout=DB_BUSY_TIMEOUT, check_same_thread=False)
+        if readonly:
+            conn.isolation_level = None  # autocommit: readers never pin an old snapshot
+        else:
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")   # only takes effect on a new, empty file
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA cache_size=-{DB_CACHE_SIZE_KB}")
+        conn.execute(f"PRAGMA mmap_size={DB_MMAP_SIZE}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        if readonly:
+            conn.execute("PRAGMA query_only=1")
+        register_sql_functions(conn)
+        return conn
+
+    @contextmanager
+    def reader(self):
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+            self.stats["reader_checkouts"] += 1
+            self.stats["readers_in_use"] += 1
+            if conn is not None:
+                self.stats["reader_reuses"] += 1
+        if conn is None:
+            conn = self._connect(readonly=True)
+            with self._lock:
+                self.stats["readers_opened"] += 1
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            with self._lock:
+                self.stats["readers_in_use"] -= 1
+                if len(self._idle) < self.max_idle_readers:
+                    self._idle.append(conn)
+                    conn = None
+                else:
+                    self.stats["readers_closed"] += 1
+            if conn is not None:
+                conn.close()
+
+    @contextmanager
+    def writer(self):
+        with self.write_lock:
+            if self._writer is None:
+                self._writer = self._connect(readonly=False)
+                self.stats["writer_opened"] += 1
+            self.stats["writer_checkouts"] += 1
+            yield self._writer
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+        with self.write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, db_file=self.db_file, readers_idle=len(self._idle))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def db_pool():
+    # one pool per process, rebuilt if DB_FILE is pointed at another file
+    global _pool
+    pool = _pool
+    if pool is None or pool.db_file != DB_FILE:
+        with _pool_lock:
+            if _pool is None or _pool.db_file != DB_FILE:
+                if _pool is not None:
+                    _pool.close()
+                _pool = ConnectionPool(DB_FILE)
+            pool = _pool
+    return pool
+
 def init_db():
-    conn = sqlite3.connect(DB_FILE)
+    with db_pool().writer() as conn:
+        create_schema(conn)
+    start_finalizer()
+    start_delete_worker()
+    start_retention()
+
+def create_schema(conn):
     c = conn.cursor()
 
-    # Create main table
+    # catalog of tests and labels, kept current by ingest (see update_catalog); the
+    # ids double as the dictionary codes stored in sample_data
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS tests (
+            id INTEGER PRIMARY KEY,
+            test_id TEXT NOT NULL UNIQUE,
+            first_ts INTEGER,
+            last_ts INTEGER,
+            samples INTEGER NOT NULL DEFAULT 0,
+            errors INTEGER NOT NULL DEFAULT 0,
+            raw_before INTEGER              -- successful samples older than this were compacted
+        )
+    """)
+    add_missing_columns(c, "tests", {"raw_before": "INTEGER"})
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS labels (
+            id INTEGER PRIMARY KEY,
+            label TEXT NOT NULL UNIQUE
+        )
+    """)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS test_labels (
+            test_ref INTEGER NOT NULL,      -- tests.id
+            label_id INTEGER NOT NULL,      -- labels.id
+            samples INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (test_ref, label_id)
+        ) WITHOUT ROWID
+    """)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS error_messages (
+            id INTEGER PRIMARY KEY,
+            message TEXT NOT NULL UNIQUE
+        )
+    """)
+
+    # Main table: label, test_id and error_message are stored as integer codes
+    layout = sample_layout(conn) or SAMPLE_LAYOUT
+    _sample_layouts[DB_FILE] = layout
+    if layout != "partitioned":
+        c.execute(sample_table_sql("sample_data", layout))
+    legacy = c.execute("SELECT type FROM sqlite_master WHERE name = 'jmeter_samples'").fetchone()
+    if legacy and legacy[0] == "table":
+        migrate_legacy_samples(conn, layout)
+    create_sample_objects(c, layout)
+
+    # Time rollups (1s / 10s / 1m / 10m), kept up to date by the ingest writer
+    for res in ROLLUP_TIERS:
+        table = rollup_table(res)
+        c.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                test_id TEXT NOT NULL,
+                bucket INTEGER NOT NULL,        -- epoch second the bucket starts at
+                label TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                errors INTEGER NOT NULL,
+                sum_rt REAL,
+                min_rt REAL,
+                max_rt REAL,
+                sum_recv REAL,
+                sum_sent REAL,
+                sum_threads INTEGER,
+                max_threads INTEGER,
+                thread_samples INTEGER,         -- samples with a thread_count, sum_threads averages over these
+                first_sec INTEGER,              -- first/last second with samples, for throughput
+                last_sec INTEGER,
+                sketch BLOB,                    -- mergeable latency sketch, see sketch_index
+                hist BLOB,                      -- exact ms -> count histogram, see encode_counts
+                PRIMARY KEY (test_id, bucket, label)
+            ) WITHOUT ROWID
+        """)
+        c.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_bucket ON {table}(bucket)")
+        stale = add_missing_columns(c, table, {"first_sec": "INTEGER", "last_sec": "INTEGER",
+                                               "sketch": "BLOB", "hist": "BLOB", "thread_samples": "INTEGER"})
+        if stale:
+            # rebuilt below from the raw samples; rows only kept as rollups (see
+            # apply_retention) assume every sample had a thread count
+            c.execute(f"UPDATE {table} SET thread_samples = count WHERE thread_samples IS NULL")
+
+    # test lifecycle: finalized tests serve full-range tables from test_summaries
     c.execute("""
-        CREATE TABLE IF NOT EXISTS jmeter_samples (
+        CREATE TABLE IF NOT EXISTS test_state (
+            test_id TEXT PRIMARY KEY,
+            status TEXT NOT NULL DEFAULT 'active',   -- 'active' or 'finalized'
+            last_ingest REAL,                        -- wall clock of the last write
+            finalized_at REAL
+        )
+    """)
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS test_summaries (
+            test_id TEXT NOT NULL,
+            kind TEXT NOT NULL,             -- 'aggregate:<method>', 'errors', 'success'
+            body TEXT NOT NULL,             -- JSON, as the endpoint returns it
+            PRIMARY KEY (test_id, kind)
+        ) WITHOUT ROWID
+    """)
+
+    # background deletions, see submit_delete_job
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS delete_jobs (
+            id INTEGER PRIMARY KEY,
+            test_id TEXT NOT NULL,
+            test_ref INTEGER,               -- tests.id when the job was submitted
+            watermark INTEGER,              -- samples with id <= watermark are deleted
+            max_bucket INTEGER,             -- and rollup buckets starting <= max_bucket
+            status TEXT NOT NULL,           -- 'queued', 'running', 'vacuuming', 'done', 'failed'
+            total INTEGER,                  -- samples the catalog counted for the test
+            deleted INTEGER NOT NULL DEFAULT 0,
+            created REAL,
+            finished REAL,
+            error TEXT
+        )
+    """)
+
+    # versions behind the read endpoints' ETags, see bump_data_version
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS data_versions (
+            scope TEXT PRIMARY KEY,         -- a test_id, '*' for changes to any test, '' for all tests
+            version INTEGER NOT NULL
+        ) WITHOUT ROWID
+    """)
+
+    # raw sample retention, see apply_retention; test_id '*' holds the global default
+    c.execute("""
+        CREATE TABLE IF NOT EXISTS retention_policy (
+            test_id TEXT PRIMARY KEY,
+            raw_days REAL NOT NULL          -- 0 keeps raw samples forever
+        )
+    """)
+
+    conn.commit()
+
+    # databases written before a tier existed get it backfilled once
+    has_samples = any(c.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone() for table in sample_tables(c))
+    has_fine = c.execute(f"SELECT 1 FROM {rollup_table(ROLLUP_TIERS[0])} LIMIT 1").fetchone()
+    has_coarse = all(c.execute(f"SELECT 1 FROM {rollup_table(res)} LIMIT 1").fetchone()
+                     for res in ROLLUP_TIERS[1:])
+    if has_samples and (stale or not has_fine):
+        rebuild_rollups(conn)
+    elif has_fine and not has_coarse:
+        rebuild_coarse_rollups(conn)
+    if has_samples and not c.execute("SELECT 1 FROM test_labels LIMIT 1").fetchone():
+        rebuild_catalog(conn)
+    # tests from before the lifecycle existed start active and idle out normally
+    if has_samples and not c.execute("SELECT 1 FROM test_state LIMIT 1").fetchone():
+        with conn:
+            conn.execute(f"""
+                INSERT OR IGNORE INTO test_state (test_id, status, last_ingest)
+                SELECT DISTINCT test_id, 'active', ? FROM {rollup_table(ROLLUP_TIERS[-1])}
+            """, (time.time(),))
+
+def migrate_legacy_samples(conn, layout):
+    # one-time move of a text-keyed jmeter_samples table into sample_data; ids are
+    # kept, since incremental aggregates use them as a watermark
+    with conn:
+        conn.execute("INSERT OR IGNORE INTO tests (test_id) "
+                     "SELECT DISTINCT test_id FROM jmeter_samples WHERE test_id IS NOT NULL")
+        conn.execute("INSERT OR IGNORE INTO labels (label) "
+                     "SELECT DISTINCT label FROM jmeter_samples WHERE label IS NOT NULL")
+        conn.execute("INSERT OR IGNORE INTO error_messages (message) "
+                     "SELECT DISTINCT error_message FROM jmeter_samples WHERE error_message IS NOT NULL")
+        copy_samples(conn, layout, f"""
+            SELECT j.id, {sample_key("j.timestamp", layout)}, {sample_key("l.id", layout)},
+                   j.response_time, j.success, j.thread_count, j.status_code, e.id,
+                   j.received_bytes, j.sent_bytes, {sample_key("t.id", layout)}
+            FROM jmeter_samples j
+            LEFT JOIN labels l ON l.label = j.label
+            LEFT JOIN error_messages e ON e.message = j.error_message
+            LEFT JOIN tests t ON t.test_id = j.test_id
+            ORDER BY j.id
+        """)
+        conn.execute("DROP TABLE jmeter_samples")
+    rebuild_catalog(conn)
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")   # applied by the VACUUM, see delete jobs
+    conn.execute("VACUUM")   # hand the space of the text columns and indexes back
+
+def add_missing_columns(cur, table, columns):
+    # ALTER TABLE in columns added after the table was first created; True if any were
+    existing = {r[1] for r in cur.execute(f"PRAGMA table_info({table})")}
+    missing = [name for name in columns if name not in existing]
+    for name in missing:
+        cur.execute(f"ALTER TABLE {table} ADD COLUMN {name} {columns[name]}")
+    return bool(missing)
+
+# --------- Sample table layout ----------
+# "rowid": sample_data is a rowid table with AUTOINCREMENT ids and five secondary
+# indexes. "clustered": a WITHOUT ROWID table keyed (test_ref, timestamp, label_id,
+# id), so the dominant read (one test, a time range, grouped by label) is a single
+# range scan of the table itself and ingest maintains two indexes instead of five.
+# "partitioned": every test gets its own table sample_data_<tests.id>, keyed by id
+# with one timestamp index, and its own decoding view jmeter_samples_<tests.id>.
+# There is no sample_data or jmeter_samples spanning all tests: per-test reads take
+# their FROM target from sample_source(test_id), cross-test maintenance loops over
+# sample_tables()/sample_sources(), and deleting a test is a DROP TABLE. Adding a
+# test creates one table, index and view, whatever the number of tests. Without a
+# jmeter_samples view there is no INSERT_SAMPLE_SQL either; ingest writes the
+# partitions directly (insert_samples).
+# Outside "rowid", ids come from sample_seq and key columns store 0 instead of NULL.
+# SAMPLE_LAYOUT only decides how new databases are created; migrate_layout.py
+# converts an existing file.
+SAMPLE_LAYOUT = "rowid"
+SAMPLE_LAYOUTS = ("rowid", "clustered", "partitioned")
+SAMPLE_COLUMNS = ("id, timestamp, label_id, response_time, success, thread_count, "
+                  "status_code, error_id, received_bytes, sent_bytes, test_ref")
+
+SAMPLE_INDEXES = {
+    "rowid": {
+        "idx_sample_time": "timestamp",
+        "idx_sample_test_time": "test_ref, timestamp",
+        "idx_sample_test_success": "test_ref, success",
+        "idx_sample_label_time": "label_id, timestamp",
+        "idx_sample_test_label_time_rt": "test_ref, label_id, timestamp, response_time",
+    },
+    "clustered": {
+        "idx_sample_time": "timestamp",
+        "idx_sample_test_seq": "test_ref, id",     # incremental aggregates read id > watermark
+    },
+    "partitioned": {},   # each partition gets a timestamp index, see create_partition
+}
+
+DECODED_SAMPLE_COLUMNS = """s.id, s.timestamp, l.label, s.response_time, s.success, s.thread_count,
+               s.status_code, e.message AS error_message, s.received_bytes, s.sent_bytes"""
+
+# first steps of the INSTEAD OF INSERT triggers: make sure the strings have codes
+DICTIONARY_TRIGGER_STEPS = """INSERT OR IGNORE INTO tests (test_id) SELECT NEW.test_id WHERE NEW.test_id IS NOT NULL;
+            INSERT OR IGNORE INTO labels (label) SELECT NEW.label WHERE NEW.label IS NOT NULL;
+            INSERT OR IGNORE INTO error_messages (message)
+                SELECT NEW.error_message WHERE NEW.error_message IS NOT NULL;"""
+
+_sample_layouts = {}   # DB_FILE -> layout of its sample_data
+
+def sample_table_sql(table, layout):
+    if layout == "partitioned":
+        # one test per table, so arrival (id) order is already clustered by test and time
+        return f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                id INTEGER PRIMARY KEY,         -- from sample_seq
+                timestamp INTEGER,
+                label_id INTEGER,
+                response_time REAL,
+                success INTEGER,
+                thread_count INTEGER,
+                status_code INTEGER,
+                error_id INTEGER,
+                received_bytes REAL,
+                sent_bytes REAL,
+                test_ref INTEGER                -- tests.id, 0 when missing
+            )
+        """
+    if layout == "clustered":
+        return f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                test_ref INTEGER NOT NULL,      -- tests.id, 0 when missing
+                timestamp INTEGER NOT NULL,     -- epoch time, 0 when missing
+                label_id INTEGER NOT NULL,      -- labels.id, 0 when missing
+                id INTEGER NOT NULL,            -- from sample_seq
+                response_time REAL,             -- ms
+                success INTEGER,                -- 0 or 1
+                thread_count INTEGER,
+                status_code INTEGER,
+                error_id INTEGER,               -- error_messages.id
+                received_bytes REAL,
+                sent_bytes REAL,
+                PRIMARY KEY (test_ref, timestamp, label_id, id)
+            ) WITHOUT ROWID
+        """
+    return f"""
+        CREATE TABLE IF NOT EXISTS {table} (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             timestamp INTEGER,              -- epoch time
-            label TEXT,                     -- request label
+            label_id INTEGER,               -- labels.id
             response_time REAL,             -- ms
             success INTEGER,                -- 0 or 1
             thread_count INTEGER,
             status_code INTEGER,            -- numeric code (better than TEXT)
-            error_message TEXT,
+            error_id INTEGER,               -- error_messages.id
             received_bytes REAL,
             sent_bytes REAL,
-            test_id TEXT
+            test_ref INTEGER                -- tests.id
         )
-    """)
+    """
 
-    # Indexes for performance
-    c.execute("CREATE INDEX IF NOT EXISTS idx_timestamp                ON jmeter_samples(timestamp)")
-    c.execute("CREATE INDEX IF NOT EXISTS idx_testid                   ON jmeter_samples(test_id)")
-    c.execute("CREATE INDEX IF NOT EXISTS idx_label                    ON jmeter_samples(label)")
-    c.execute("CREATE INDEX IF NOT EXISTS idx_success                  ON jmeter_samples(success)")
-    c.execute("CREATE INDEX IF NOT EXISTS idx_samples_testid_time      ON jmeter_samples(test_id, timestamp)")
-    c.execute("CREATE INDEX IF NOT EXISTS idx_testid_label             ON jmeter_samples(test_id, label)")
-    c.execute("CREATE INDEX IF NOT EXISTS idx_testid_success           ON jmeter_samples(test_id, success)")
-    c.execute("CREATE INDEX IF NOT EXISTS idx_label_timestamp          ON jmeter_samples(label, timestamp)")
-    c.execute("CREATE INDEX IF NOT EXISTS idx_testid_label_time_rt     ON jmeter_samples(test_id, label, timestamp, response_time)")
+def sample_key(expr, layout):
+    # SQL for a key column value; the WITHOUT ROWID primary keys cannot hold NULL
+    return f"COALESCE({expr}, 0)" if layout != "rowid" else expr
+
+def create_sample_objects(c, layout):
+    # jmeter_samples keeps its old columns as a decoding view, so every query and
+    # INSERT_SAMPLE_SQL work unchanged; partitions each get their own view instead
+    if layout == "partitioned":
+        c.execute("DROP VIEW IF EXISTS jmeter_samples")   # UNION ALL views of older versions
+        c.execute("DROP VIEW IF EXISTS sample_data")
+        for ref in partition_refs(c):
+            create_partition_view(c, ref)
+    else:
+        c.execute(f"""
+            CREATE VIEW IF NOT EXISTS jmeter_samples AS
+            SELECT {DECODED_SAMPLE_COLUMNS}, t.test_id
+            FROM sample_data s
+            LEFT JOIN labels l ON l.id = s.label_id
+            LEFT JOIN error_messages e ON e.id = s.error_id
+            LEFT JOIN tests t ON t.id = s.test_ref
+        """)
+    if layout != "rowid":
+        c.execute("CREATE TABLE IF NOT EXISTS sample_seq (next_id INTEGER NOT NULL)")
+        if not c.execute("SELECT 1 FROM sample_seq").fetchone():
+            c.execute("INSERT INTO sample_seq (next_id) VALUES (?)",
+                      (max([c.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0]
+                            for table in sample_tables(c, layout)] or [0]) + 1,))
+    if layout == "partitioned":
+        return
+    if layout == "clustered":
+        new_id, seq_step = "(SELECT next_id FROM sample_seq)", "UPDATE sample_seq SET next_id = next_id + 1;"
+    else:
+        new_id, seq_step = "NULL", ""
+    label_ref = sample_key("(SELECT id FROM labels WHERE label = {0}.label)", layout)
+    test_ref = sample_key("(SELECT id FROM tests WHERE test_id = {0}.test_id)", layout)
+    c.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS jmeter_samples_insert INSTEAD OF INSERT ON jmeter_samples
+        BEGIN
+            {DICTIONARY_TRIGGER_STEPS}
+            INSERT INTO sample_data ({SAMPLE_COLUMNS})
+            VALUES ({new_id}, {sample_key("NEW.timestamp", layout)}, {label_ref.format("NEW")},
+                    NEW.response_time, NEW.success, NEW.thread_count, NEW.status_code,
+                    (SELECT id FROM error_messages WHERE message = NEW.error_message),
+                    NEW.received_bytes, NEW.sent_bytes, {test_ref.format("NEW")});
+            {seq_step}
+        END
+    """)
+    if layout == "clustered":
+        match = (f"test_ref = {test_ref.format('OLD')} AND timestamp = OLD.timestamp "
+                 f"AND label_id = {label_ref.format('OLD')} AND id = OLD.id")
+    else:
+        match = "id = OLD.id"
+    c.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS jmeter_samples_delete INSTEAD OF DELETE ON jmeter_samples
+        BEGIN
+            DELETE FROM sample_data WHERE {match};
+        END
+    """)
+    for name, columns in SAMPLE_INDEXES[layout].items():
+        c.execute(f"CREATE INDEX IF NOT EXISTS {name} ON sample_data({columns})")
+
+def partition_table(ref):
+    return f"sample_data_{int(ref)}"
+
+def partition_view(ref):
+    return f"jmeter_samples_{int(ref)}"
+
+def partition_refs(conn):
+    # tests.id of every partition table, ascending
+    rows = conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' "
+                        "AND name GLOB 'sample_data_[0-9]*'").fetchall()
+    return sorted(int(name[len("sample_data_"):]) for (name,) in rows)
+
+def create_partition(conn, ref):
+    table = partition_table(ref)
+    conn.execute(sample_table_sql(table, "partitioned"))
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_time ON {table}(timestamp)")
+    create_partition_view(conn, ref)
+
+def create_partition_view(conn, ref):
+    # the jmeter_samples columns for one partition; ref 0 holds samples without a
+    # test_id, which decode to NULL
+    conn.execute(f"""
+        CREATE VIEW IF NOT EXISTS {partition_view(ref)} AS
+        SELECT {DECODED_SAMPLE_COLUMNS}, t.test_id
+        FROM {partition_table(ref)} s
+        LEFT JOIN tests t ON t.id = s.test_ref
+        LEFT JOIN labels l ON l.id = s.label_id
+        LEFT JOIN error_messages e ON e.id = s.error_id
+    """)
 
-    conn.commit()
-    conn.close()
-def run_query(query, params=()):
-    conn = sqlite3.connect(DB_FILE)
-    cur = conn.cursor()
-    cur.execute(query, params)
+def drop_partition(conn, ref):
+    conn.execute(f"DROP VIEW IF EXISTS {partition_view(ref)}")
+    conn.execute(f"DROP TABLE {partition_table(ref)}")
+
+def sample_tables(conn, layout=None):
+    # every table holding raw sample_data rows
+    if (layout or current_layout(conn)) == "partitioned":
+        return [partition_table(ref) for ref in partition_refs(conn)]
+    return ["sample_data"]
+
+def sample_sources(conn):
+    # decoding views (jmeter_samples columns) that together cover every sample
+    if current_layout(conn) == "partitioned":
+        return [partition_view(ref) for ref in partition_refs(conn)]
+    return ["jmeter_samples"]
+
+EMPTY_SAMPLE_SOURCE = "(SELECT " + ", ".join(
+    f"NULL AS {col}" for col in ("id", "timestamp", "label", "response_time", "success", "thread_count",
+                                 "status_code", "error_message", "received_bytes", "sent_bytes",
+                                 "test_id")) + " WHERE 0)"
+
+def sample_source(test_id, conn=None):
+    # FROM target with one test's decoded samples; on the partitioned layout the
+    # test's own view, so the query never plans another test's table
+    if current_layout(conn) != "partitioned":
+        return "jmeter_samples"
+    q = ("SELECT t.id FROM tests t JOIN sqlite_master m ON m.type = 'view' "
+         "AND m.name = 'jmeter_samples_' || t.id WHERE t.test_id = ?")
+    rows = conn.execute(q, (test_id,)).fetchall() if conn is not None else run_query(q, (test_id,))
+    return partition_view(rows[0][0]) if rows else EMPTY_SAMPLE_SOURCE
+
+def sample_layout(conn):
+    # layout of this database's sample_data, None before it exists
+    row = conn.execute("SELECT type, sql FROM sqlite_master WHERE name = 'sample_data'").fetchone()
+    if row is None:
+        # partitioned files have no sample_data, only the id sequence and partitions
+        seq = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sample_seq'").fetchone()
+        return "partitioned" if seq else None
+    if row[0] == "view":   # the UNION ALL view of older partitioned files
+        return "partitioned"
+    return "clustered" if "WITHOUT ROWID" in row[1].upper() else "rowid"
+
+def current_layout(conn=None):
+    layout = _sample_layouts.get(DB_FILE)
+    if layout is None:
+        if conn is None:
+            with db_pool().reader() as reader:
+                return current_layout(reader)
+        layout = _sample_layouts[DB_FILE] = sample_layout(conn)
+    return layout
+
+def allocate_sample_ids(conn, n):
+    # ids for n new rows inside the caller's transaction; None on the rowid layout,
+    # where AUTOINCREMENT picks them
+    if current_layout(conn) == "rowid":
+        return None
+    last = conn.execute("UPDATE sample_seq SET next_id = next_id + ? RETURNING next_id", (n,)).fetchall()[0][0]
+    return range(last - n, last)
+
+def insert_samples(conn, encoded):
+    # encoded rows (INSERT_SAMPLE_DATA_SQL tuples) into sample_data or, when
+    # partitioned, into each test's table, creating new partitions on the way
+    if current_layout(conn) != "partitioned":
+        conn.executemany(INSERT_SAMPLE_DATA_SQL.format(table="sample_data"), encoded)
+        return
+    parts = {}
+    for r in encoded:
+        parts.setdefault(r[10], []).append(r)
+    for ref in parts.keys() - set(partition_refs(conn)):
+        create_partition(conn, ref)
+    for ref, rows in parts.items():
+        conn.executemany(INSERT_SAMPLE_DATA_SQL.format(table=partition_table(ref)), rows)
+
+def copy_samples(conn, layout, select_sql):
+    # INSERT ... SELECT of full sample_data rows (SAMPLE_COLUMNS order, keys already
+    # coalesced) into the layout's storage. Partitions are filled from a staging
+    # table clustered by test, so the source is read once whatever the test count.
+    if layout != "partitioned":
+        conn.execute(f"INSERT INTO sample_data ({SAMPLE_COLUMNS}) {select_sql}")
+        return
+    conn.execute(sample_table_sql("sample_data_stage", "clustered"))
+    conn.execute(f"INSERT INTO sample_data_stage ({SAMPLE_COLUMNS}) {select_sql}")
+    for (ref,) in conn.execute("SELECT 0 UNION ALL SELECT id FROM tests").fetchall():
+        if conn.execute("SELECT 1 FROM sample_data_stage WHERE test_ref = ? LIMIT 1", (ref,)).fetchone():
+            create_partition(conn, ref)
+            conn.execute(f"INSERT INTO {partition_table(ref)} ({SAMPLE_COLUMNS}) "
+                         f"SELECT {SAMPLE_COLUMNS} FROM sample_data_stage WHERE test_ref = ?", (ref,))
+    conn.execute("DROP TABLE sample_data_stage")
+
+def last_sample_id(conn):
+    # highest id handed out so far; later samples get larger ids
+    if current_layout(conn) == "rowid":
+        return conn.execute("SELECT COALESCE(MAX(id), 0) FROM sample_data").fetchone()[0]
+    return conn.execute("SELECT next_id - 1 FROM sample_seq").fetchone()[0]
+
+def delete_sample_batch(conn, test_ref, watermark, limit):
+    # up to `limit` samples of one test with id <= watermark, inside the caller's
+    # transaction; returns how many were deleted. A partition holding nothing newer
+    # is dropped whole.
+    table = "sample_data"
+    if current_layout(conn) == "partitioned":
+        if test_ref not in partition_refs(conn):
+            return 0
+        table = partition_table(test_ref)
+        if not conn.execute(f"SELECT 1 FROM {table} WHERE id > ? LIMIT 1", (watermark,)).fetchone():
+            count = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+            drop_partition(conn, test_ref)
+            return count
+    return conn.execute(f"""
+        DELETE FROM {table} WHERE test_ref = ? AND id IN (
+            SELECT id FROM {table} WHERE test_ref = ? AND id <= ? LIMIT ?)
+    """, (test_ref, test_ref, watermark, limit)).rowcount
+
+def delete_expired_sample_batch(conn, test_ref, cutoff, limit):
+    # up to `limit` successful samples of one test older than `cutoff`, inside the
+    # caller's transaction; failed samples are kept (see apply_retention)
+    table = "sample_data"
+    if current_layout(conn) == "partitioned":
+        if test_ref not in partition_refs(conn):
+            return 0
+        table = partition_table(test_ref)
+    return conn.execute(f"""
+        DELETE FROM {table} WHERE test_ref = ? AND id IN (
+            SELECT id FROM {table} WHERE test_ref = ? AND timestamp < ? AND success IS NOT 0 LIMIT ?)
+    """, (test_ref, test_ref, cutoff, limit)).rowcount
+
+def convert_sample_layout(conn, layout):
+    # rewrite sample_data in another layout, keeping ids; run with the server stopped.
+    # Returns False if the table already has that layout.
+    current = sample_layout(conn)
+    if current == layout:
+        return False
+    refs = partition_refs(conn) if current == "partitioned" else []
+    with conn:
+        conn.execute("DROP VIEW IF EXISTS jmeter_samples")   # its triggers go with it
+        if current == "partitioned":
+            conn.execute("DROP VIEW IF EXISTS sample_data")
+            for ref in refs:
+                conn.execute(f"DROP VIEW IF EXISTS {partition_view(ref)}")
+            sources = [partition_table(ref) for ref in refs]
+        else:
+            for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' "
+                                        "AND tbl_name = 'sample_data' AND sql IS NOT NULL").fetchall():
+                conn.execute(f"DROP INDEX {name}")
+            conn.execute("ALTER TABLE sample_data RENAME TO sample_data_old")
+            sources = ["sample_data_old"]
+        if layout != "partitioned":
+            conn.execute(sample_table_sql("sample_data", layout))
+        for source in sources:   # one partition at a time when converting from partitioned
+            copy_samples(conn, layout, f"""
+                SELECT id, {sample_key("timestamp", layout)}, {sample_key("label_id", layout)},
+                       response_time, success, thread_count, status_code, error_id,
+                       received_bytes, sent_bytes, {sample_key("test_ref", layout)}
+                FROM {source} ORDER BY {"test_ref, timestamp, label_id, id" if layout == "clustered" else "id"}
+            """)
+            conn.execute(f"DROP TABLE {source}")
+        if layout == "rowid":
+            conn.execute("DROP TABLE IF EXISTS sample_seq")
+        create_sample_objects(conn.cursor(), layout)
+    _sample_layouts.clear()
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    conn.execute("VACUUM")
+    return True
+
+_snapshot = threading.local()
+
+@contextmanager
+def read_snapshot():
+    # every SELECT run_query issues on this thread inside the block reads the same
+    # WAL snapshot, so panels computed together agree with each other
+    if getattr(_snapshot, "conn", None) is not None:
+        yield _snapshot.conn
+        return
+    with db_pool().reader() as conn:
+        conn.execute("BEGIN")
+        _snapshot.conn = conn
+        try:
+            yield conn
+        finally:
+            _snapshot.conn = None
+            conn.rollback()
+
+def execute_query(query, params=()):
+    # SELECTs run on a pooled read-only connection, everything else on the writer
+    pool = db_pool()
     if query.strip().upper().startswith("SELECT"):
-        rows = cur.fetchall()
+        snap = getattr(_snapshot, "conn", None)
+        if snap is not None:
+            cur = snap.execute(query, params)
+            rows = cur.fetchall()
+        else:
+            with pool.reader() as conn:
+                cur = conn.execute(query, params)
+                rows = cur.fetchall()
     else:
-        rows = []
-    conn.commit()
-    conn.close()
-    return rows
+        with pool.writer() as conn:
+            with conn:
+                cur = conn.execute(query, params)
+                rows = cur.fetchall() if cur.description else []
+    columns = [desc[0] for desc in cur.description] if cur.description else []
+    return columns, rows
+
+def run_query(query, params=()):
+    return execute_query(query, params)[1]
+
+@app.route("/api/pool_stats", methods=["GET"])
+def api_pool_stats():
+    return jsonify(db_pool().snapshot())
 
 @app.route("/api/dbfiles", methods=["GET"])
 def api_dbfiles():
     db_files = [os.path.basename(f) for f in glob.glob("*.db")]
     return jsonify(db_files)
 # --------- Ingest endpoint (JMeter posts here) ----------
-@app.route("/metrics", methods=["POST"])
-def receive_metrics():
-    data = request.get_json(force=True)
-    conn = sqlite3.connect(DB_FILE)
-    c = conn.cursor()
-    c.execute("""
-        INSERT INTO jmeter_samples (
-            timestamp, label, response_time, success, thread_count,
-            status_code, error_message, received_bytes, sent_bytes, test_id
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (
+INSERT_SAMPLE_SQL = """
+    INSERT INTO jmeter_samples (
+        timestamp, label, response_time, success, thread_count,
+        status_code, error_message, received_bytes, sent_bytes, test_id
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+def sample_row(data):
+    # map one posted JSON sample onto the jmeter_samples insert tuple
+    return (
         data.get("timestamp"),
         data.get("label"),
         data.get("response_time"),
@@ -104,11 +762,955 @@ def receive_metrics():
         data.get("received_bytes", 0),
         data.get("sent_bytes", 0),
         data.get("test_id", "default")
-    ))
-    conn.commit()
-    conn.close()
+    )
+
+# numeric fields and the largest magnitude each may carry: response times become
+# int32 histogram keys, the rest must bind as SQLite integers without overflow
+SAMPLE_NUMERIC_LIMITS = {
+    "timestamp": 2 ** 53, "response_time": 2 ** 31 - 1, "success": 2 ** 53,
+    "thread_count": 2 ** 53, "received_bytes": 2 ** 53, "sent_bytes": 2 ** 53,
+}
+SAMPLE_TEXT_FIELDS = ("label", "test_id", "error_message")
+
+def well_typed_sample(data):
+    # a sample the writer can always store: finite, bounded numbers and strings
+    # (or null); one bad value would otherwise fail the whole commit group
+    if not isinstance(data, dict):
+        return False
+    for field, limit in SAMPLE_NUMERIC_LIMITS.items():
+        v = data.get(field)
+        if v is None:
+            continue
+        if not isinstance(v, (int, float)) or not math.isfinite(v) or abs(v) > limit:
+            return False
+    for field in SAMPLE_TEXT_FIELDS:
+        if not isinstance(data.get(field), (str, type(None))):
+            return False
+    return isinstance(data.get("status_code"), (str, int, float, type(None)))
+
+def valid_sample(data):
+    # batch ingest rejects samples that could never show up on the dashboard
+    if not well_typed_sample(data):
+        return False
+    label = data.get("label")
+    if not isinstance(label, str) or not label.strip():
+        return False
+    try:
+        int(data.get("timestamp"))
+    except (TypeError, ValueError):
+        return False
+    return True
+
+def parse_batch_body(raw):
+    # accepts a JSON array of samples or NDJSON (one sample per line);
+    # lines that are not valid JSON come back as None so they count as rejected
+    text = raw.decode("utf-8", errors="replace").strip()
+    if not text:
+        return []
+    if text.startswith("["):
+        try:
+            items = json.loads(text)
+        except ValueError:
+            return None
+        return items if isinstance(items, list) else None
+    items = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            items.append(json.loads(line))
+        except ValueError:
+            items.append(None)
+    return items
+
+def write_samples(rows):
+    # oldest new timestamp per test, for the result cache's window check
+    touched = {}
+    for r in rows:
+        ts = as_number(r[0], float("-inf"))
+        if ts < touched.get(r[9], float("inf")):
+            touched[r[9]] = ts
+    with db_pool().writer() as conn:
+        with conn:  # one transaction per group commit
+            encoded, fresh = encode_samples(conn, rows)
+            insert_samples(conn, encoded)
+            write_rollups(conn, rows)
+            update_catalog(conn, rows)
+            mark_tests_active(conn, touched)
+            bump_data_version(conn, touched)
+        remember_codes(fresh)
+        RESULT_CACHE.invalidate(touched)
+        invalidate_closed_windows(touched)
+
+# --------- Dictionary encoding ----------
+# sample_data stores test_id, label and error_message as ids into tests, labels
+# and error_messages. The writer encodes through these caches (a database round
+# trip only for strings it has never seen); reads decode through the jmeter_samples
+# view, which joins the tables back in.
+INSERT_SAMPLE_DATA_SQL = """
+    INSERT INTO {table} (
+        id, timestamp, label_id, response_time, success, thread_count,
+        status_code, error_id, received_bytes, sent_bytes, test_ref
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+class Dictionary:
+    """Write-side cache of one string lookup table, reset when DB_FILE changes."""
+
+    def __init__(self, table, column):
+        self.table = table
+        self.column = column
+        self._ids = {}
+        self._db_file = None
+        self._lock = threading.Lock()
+
+    def _current(self):
+        if self._db_file != DB_FILE:
+            self._ids.clear()
+            self._db_file = DB_FILE
+
+    def encode(self, conn, values):
+        # value -> id for every value (None stays None), inserting unseen strings on
+        # the caller's transaction; the new ids are returned separately so they are
+        # only cached once that transaction has committed
+        with self._lock:
+            self._current()
+            codes = {v: self._ids.get(v) for v in values}
+        fresh = {}
+        for v, code in codes.items():
+            if code is None and v is not None:
+                conn.execute(f"INSERT OR IGNORE INTO {self.table} ({self.column}) VALUES (?)", (v,))
+                code = conn.execute(f"SELECT id FROM {self.table} WHERE {self.column} = ?", (v,)).fetchone()[0]
+                codes[v] = fresh[v] = code
+        return codes, fresh
+
+    def remember(self, fresh):
+        with self._lock:
+            self._current()
+            self._ids.update(fresh)
+
+    def forget(self, value):
+        with self._lock:
+            self._ids.pop(value, None)
+
+    def clear(self):
+        with self._lock:
+            self._ids.clear()
+
+TESTS = Dictionary("tests", "test_id")
+LABELS = Dictionary("labels", "label")
+ERROR_MESSAGES = Dictionary("error_messages", "message")
+
+def encode_samples(conn, rows):
+    # sample_row tuples -> INSERT_SAMPLE_DATA_SQL tuples
+    tests, fresh_tests = TESTS.encode(conn, {r[9] for r in rows})
+    labels, fresh_labels = LABELS.encode(conn, {r[1] for r in rows})
+    errors, fresh_errors = ERROR_MESSAGES.encode(conn, {r[6] for r in rows})
+    ids = allocate_sample_ids(conn, len(rows))
+    if ids is None:
+        ids = [None] * len(rows)
+    else:  # clustered layout: key columns cannot be NULL
+        tests[None] = labels[None] = 0
+        rows = [(0,) + tuple(r[1:]) if r[0] is None else r for r in rows]
+    encoded = [(sid, ts, labels[label], rt, succ, threads, status, errors[err], recv, sent, tests[test_id])
+               for sid, (ts, label, rt, succ, threads, status, err, recv, sent, test_id) in zip(ids, rows)]
+    return encoded, ((TESTS, fresh_tests), (LABELS, fresh_labels), (ERROR_MESSAGES, fresh_errors))
+
+def remember_codes(fresh):
+    for dictionary, codes in fresh:
+        dictionary.remember(codes)
+
+# --------- Data versions and ETags ----------
+# Every committed change bumps a version row in data_versions for the tests it
+# touched (and the '' row, which covers "all tests"), inside the same transaction.
+# Read endpoints hash that version with their params into an ETag, so a client
+# re-polling a finished test gets a 304 without the samples being read. The rows
+# live in the database, so writes from other processes on the same file change
+# the tags too; BOOT_ID keeps tags from matching across a restart, when the
+# response format may have changed.
+BOOT_ID = f"{os.getpid()}-{time.time()}"
+ALL_TESTS_SCOPE = ""
+
+def bump_data_version(conn, test_ids=None):
+    # inside the caller's transaction; test_ids=None means the change could touch
+    # anything (custom SQL)
+    scopes = {"*"} if test_ids is None else {t for t in test_ids if t is not None}
+    scopes.add(ALL_TESTS_SCOPE)
+    conn.executemany("""
+        INSERT INTO data_versions (scope, version) VALUES (?, 1)
+        ON CONFLICT(scope) DO UPDATE SET version = version + 1
+    """, [(scope,) for scope in scopes])
+
+def data_version(test_id):
+    scope = ALL_TESTS_SCOPE if test_id is None else test_id
+    versions = dict(run_query("SELECT scope, version FROM data_versions WHERE scope IN ('*', ?)", (scope,)))
+    return versions.get("*", 0), versions.get(scope, 0)
+
+def request_key(test_id, moving):
+    # endpoint + normalized params + the data version the response is computed
+    # at, so a request never shares a body computed before a write it can see; an
+    # open-ended window slides with the clock even when no data arrives, so it
+    # also carries the current second
+    args = tuple(sorted(request.args.items(multi=True)))
+    tick = int(time.time()) if moving and not request.args.get("end") else None
+    return (DB_FILE, request.path, args, data_version(test_id), tick)
+
+def request_etag(key):
+    return hashlib.sha1(repr((BOOT_ID, key)).encode()).hexdigest()[:20]
+
+def conditional_get(default_test_id=None, moving=False):
+    # answers If-None-Match with 304 while the test's data version is unchanged,
+    # otherwise serves the body from RESULT_CACHE or runs the view and caches it
+    def decorate(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            test_id = request.args.get("test_id") or default_test_id
+            key = request_key(test_id, moving)
+            tag = request_etag(key)
+            if tag in request.if_none_match:
+                resp = Response(status=304)
+            else:
+                body = RESULT_CACHE.get(key)
+                if body is not None:
+                    resp = Response(body, mimetype="application/json")
+                else:
+                    # identical requests arriving while this one computes wait for
+                    # it and share the response instead of running their own scan
+                    def compute():
+                        token = RESULT_CACHE.token()
+                        r = make_response(view(*args, **kwargs))
+                        if r.status_code == 200:
+                            RESULT_CACHE.put(key, r.get_data(), test_id,
+                                             request.args.get("end", type=int), token)
+                        return r.status_code, r.get_data(), r.mimetype
+                    status, body, mimetype = SINGLE_FLIGHT.do(key, compute)
+                    resp = Response(body, status=status, mimetype=mimetype)
+                    if status != 200:
+                        return resp
+            resp.set_etag(tag)
+            resp.headers["Cache-Control"] = "no-cache"
+            return resp
+        return wrapper
+    return decorate
+
+# --------- Result cache ----------
+RESULT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+RESULT_CACHE_TTL = 300       # seconds; entries keyed on an older data version are unreachable, this ages them out
+RESULT_CACHE_LOG = 1024      # recent invalidations remembered for in-flight puts
+
+class ResultCache:
+    """LRU + TTL cache of serialized read-endpoint responses, bounded by bytes.
+
+    Each entry remembers its test and window end. Ingest only drops entries whose
+    test it wrote to (entries without a test cover all tests) and whose window
+    ends at or after the oldest new sample, so closed windows survive a live test.
+    """
+
+    def __init__(self, max_bytes, ttl):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = collections.OrderedDict()   # key -> (body, expires, test_id, end)
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._seq = 0
+        self._log = collections.deque(maxlen=RESULT_CACHE_LOG)   # (seq, test_id, ts)
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0,
+                      "invalidations": 0, "skipped_puts": 0}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            if entry[1] < time.monotonic():
+                self._drop(key)
+                self.stats["expirations"] += 1
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[0]
+
+    def token(self):
+        # taken before computing; put() refuses results a concurrent write made stale
+        with self._lock:
+            return self._seq
+
+    def put(self, key, body, test_id, end, token):
+        if len(body) > self.max_bytes // 8:
+            return
+        with self._lock:
+            if self._stale_since(token, test_id, end):
+                self.stats["skipped_puts"] += 1
+                return
+            if key in self._entries:
+                self._drop(key)
+            # keys carrying a clock tick are only reusable within that second
+            ttl = self.ttl if key[-1] is None else 2
+            self._entries[key] = (body, time.monotonic() + ttl, test_id, end)
+            self._bytes += len(body)
+            while self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.stats["evictions"] += 1
+
+    def invalidate(self, touched):
+        # touched: {test_id: oldest timestamp written}
+        with self._lock:
+            for test_id, ts in touched.items():
+                self._seq += 1
+                self._log.append((self._seq, test_id, ts))
+            for key, (_, _, test_id, end) in list(self._entries.items()):
+                if test_id is not None and test_id not in touched:
+                    continue
+                oldest = touched[test_id] if test_id is not None else min(touched.values())
+                if end is None or end >= oldest:
+                    self._drop(key)
+                    self.stats["invalidations"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._seq += 1
+            self._log.append((self._seq, None, float("-inf")))
+            self.stats["invalidations"] += len(self._entries)
+            self._entries.clear()
+            self._bytes = 0
+
+    def unchanged(self, token, test_id, end):
+        # no write since token() could have changed test_id's window ending at `end`
+        with self._lock:
+            return not self._stale_since(token, test_id, end)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, entries=len(self._entries), bytes=self._bytes,
+                        max_bytes=self.max_bytes, ttl=self.ttl)
+
+    def _stale_since(self, token, test_id, end):
+        if token == self._seq:
+            return False
+        if not self._log or self._log[0][0] > token + 1:
+            return True   # the log no longer reaches back to the token
+        for seq, t, ts in self._log:
+            if seq > token and (test_id is None or t is None or t == test_id) and (end is None or end >= ts):
+                return True
+        return False
+
+    def _drop(self, key):
+        body = self._entries.pop(key)[0]
+        self._bytes -= len(body)
+
+RESULT_CACHE = ResultCache(RESULT_CACHE_MAX_BYTES, RESULT_CACHE_TTL)
+
+class InFlight:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """Runs at most one computation per key; concurrent callers share its result."""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.stats = {"computed": 0, "shared": 0}
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = InFlight()
+                self.stats["computed"] += 1
+            else:
+                self.stats["shared"] += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, in_flight=len(self._calls))
+
+SINGLE_FLIGHT = SingleFlight()
+
+@app.route("/api/cache_stats", methods=["GET"])
+def api_cache_stats():
+    return jsonify(dict(RESULT_CACHE.snapshot(), single_flight=SINGLE_FLIGHT.snapshot()))
+
+# --------- Time rollups ----------
+ROLLUP_TIERS = (1, 10, 60, 600)   # bucket widths in seconds, finest first
+MAX_SERIES_POINTS = 1500          # time-series endpoints pick the finest tier under this
+
+ROLLUP_COLUMNS = """
+    test_id, bucket, label, count, errors, sum_rt, min_rt, max_rt,
+    sum_recv, sum_sent, sum_threads, max_threads, thread_samples, first_sec, last_sec, sketch, hist
+"""
+
+def rollup_table(res):
+    return f"sample_rollup_{res}s"
+
+def rollup_upsert_sql(res):
+    return f"""
+        INSERT INTO {rollup_table(res)} ({ROLLUP_COLUMNS})
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        {ROLLUP_MERGE}
+    """
+
+# folds an inserted rollup row into an existing one for the same key
+ROLLUP_MERGE = """
+        ON CONFLICT (test_id, bucket, label) DO UPDATE SET
+            count = count + excluded.count,
+            errors = errors + excluded.errors,
+            sum_rt = sum_rt + excluded.sum_rt,
+            min_rt = MIN(COALESCE(min_rt, excluded.min_rt), COALESCE(excluded.min_rt, min_rt)),
+            max_rt = MAX(COALESCE(max_rt, excluded.max_rt), COALESCE(excluded.max_rt, max_rt)),
+            sum_recv = sum_recv + excluded.sum_recv,
+            sum_sent = sum_sent + excluded.sum_sent,
+            sum_threads = sum_threads + excluded.sum_threads,
+            max_threads = MAX(max_threads, excluded.max_threads),
+            thread_samples = thread_samples + excluded.thread_samples,
+            first_sec = MIN(first_sec, excluded.first_sec),
+            last_sec = MAX(last_sec, excluded.last_sec),
+            sketch = counts_merge(sketch, excluded.sketch),
+            hist = counts_merge(hist, excluded.hist)
+"""
+
+def as_number(v, default=0):
+    try:
+        return float(v) if v is not None else default
+    except (TypeError, ValueError):
+        return default
+
+class RollupBucket:
+    """In-memory accumulator for one (test_id, bucket, label) rollup row."""
+
+    __slots__ = ("count", "errors", "sum_rt", "min_rt", "max_rt", "sum_recv", "sum_sent",
+                 "sum_threads", "max_threads", "thread_samples", "first_sec", "last_sec", "sketch", "hist")
+
+    def __init__(self, sec):
+        self.count = self.errors = 0
+        self.sum_rt = self.sum_recv = self.sum_sent = 0.0
+        self.min_rt = self.max_rt = None
+        self.sum_threads = self.max_threads = self.thread_samples = 0
+        self.first_sec = self.last_sec = sec
+        self.sketch = {}
+        self.hist = {}
+
+    def add(self, rt, is_error, recv, sent, threads):
+        self.count += 1
+        if is_error:
+            self.errors += 1
+        if rt is not None:
+            self.sum_rt += rt
+            if self.min_rt is None or rt < self.min_rt:
+                self.min_rt = rt
+            if self.max_rt is None or rt > self.max_rt:
+                self.max_rt = rt
+            idx = sketch_index(rt)
+            self.sketch[idx] = self.sketch.get(idx, 0) + 1
+            ms = int(rt)
+            self.hist[ms] = self.hist.get(ms, 0) + 1
+        self.sum_recv += recv
+        self.sum_sent += sent
+        if threads is not None:   # like AVG(thread_count), missing counts are skipped
+            self.sum_threads += threads
+            self.thread_samples += 1
+            if threads > self.max_threads:
+                self.max_threads = threads
+
+    def merge(self, other):
+        self.count += other.count
+        self.errors += other.errors
+        self.sum_rt += other.sum_rt
+        if other.min_rt is not None and (self.min_rt is None or other.min_rt < self.min_rt):
+            self.min_rt = other.min_rt
+        if other.max_rt is not None and (self.max_rt is None or other.max_rt > self.max_rt):
+            self.max_rt = other.max_rt
+        self.sum_recv += other.sum_recv
+        self.sum_sent += other.sum_sent
+        self.sum_threads += other.sum_threads
+        self.max_threads = max(self.max_threads, other.max_threads)
+        self.thread_samples += other.thread_samples
+        self.first_sec = min(self.first_sec, other.first_sec)
+        self.last_sec = max(self.last_sec, other.last_sec)
+        add_counts(self.sketch, other.sketch)
+        add_counts(self.hist, other.hist)
+
+    def row(self, key):
+        return key + (self.count, self.errors, self.sum_rt, self.min_rt, self.max_rt,
+                      self.sum_recv, self.sum_sent, self.sum_threads, self.max_threads,
+                      self.thread_samples, self.first_sec, self.last_sec, encode_counts(self.sketch),
+                      encode_counts(self.hist))
+
+def rollup_buckets(rows):
+    # fold sample insert tuples into one accumulator per (test_id, second, label)
+    acc = {}
+    for ts, label, rt, succ, threads, _status, _err, recv, sent, test_id in rows:
+        try:
+            sec = int(float(ts))
+        except (TypeError, ValueError):
+            continue  # no timestamp, never shows up in a time series
+        key = (test_id or "default", sec, label or "")
+        threads = as_number(threads, None)
+        if threads is not None:
+            threads = int(threads)
+        b = acc.get(key)
+        if b is None:
+            b = acc[key] = RollupBucket(sec)
+        b.add(None if rt is None else as_number(rt), as_number(succ, 1) == 0,
+              as_number(recv), as_number(sent), threads)
+    return acc
+
+def coarsen_buckets(fine, res):
+    # merge per-second accumulators into res-second buckets
+    acc = {}
+    for (test_id, sec, label), b in fine.items():
+        key = (test_id, sec - sec % res, label)
+        target = acc.get(key)
+        if target is None:
+            target = acc[key] = RollupBucket(b.first_sec)
+        target.merge(b)
+    return acc
+
+def write_rollups(conn, rows):
+    fine = rollup_buckets(rows)
+    for res in ROLLUP_TIERS:
+        tier = fine if res == 1 else coarsen_buckets(fine, res)
+        conn.executemany(rollup_upsert_sql(res), [b.row(key) for key, b in tier.items()])
+
+# per-second rollup rows computed from raw samples, and a coarser tier's rows
+# computed from the per-second tier; {source} is a sample_sources() view and
+# {where} narrows the rows read. Sources are merged in, since samples without a
+# test_id and those of test 'default' share rollup rows but not a partition.
+ROLLUP_FROM_SAMPLES_SQL = f"""
+    INSERT INTO {rollup_table(1)} ({ROLLUP_COLUMNS})
+    SELECT COALESCE(test_id, 'default'), CAST(timestamp AS INTEGER), COALESCE(label, ''),
+           COUNT(*), SUM(CASE WHEN success=0 THEN 1 ELSE 0 END),
+           COALESCE(SUM(response_time), 0), MIN(response_time), MAX(response_time),
+           COALESCE(SUM(received_bytes), 0), COALESCE(SUM(sent_bytes), 0),
+           COALESCE(SUM(thread_count), 0), COALESCE(MAX(thread_count), 0), COUNT(thread_count),
+           CAST(timestamp AS INTEGER), CAST(timestamp AS INTEGER),
+           sketch_agg(response_time), hist_agg(response_time)
+    FROM {{source}} j
+    WHERE timestamp IS NOT NULL AND {{where}}
+    GROUP BY 1, 2, 3
+    {ROLLUP_MERGE}
+"""
+
+def coarse_rollup_sql(res, where="1"):
+    return f"""
+        INSERT INTO {rollup_table(res)} ({ROLLUP_COLUMNS})
+        SELECT test_id, bucket - bucket % {res}, label,
+               SUM(count), SUM(errors), SUM(sum_rt), MIN(min_rt), MAX(max_rt),
+               SUM(sum_recv), SUM(sum_sent), SUM(sum_threads), MAX(max_threads),
+               SUM(thread_samples), MIN(first_sec), MAX(last_sec), counts_merge_agg(sketch),
+               counts_merge_agg(hist)
+        FROM {rollup_table(1)}
+        WHERE {where}
+        GROUP BY 1, 2, 3
+    """
+
+def rebuild_rollups(conn):
+    # recompute every tier from raw samples (backfill / repair); seconds before a
+    # test's retention horizon only exist as rollups and are kept
+    with conn:
+        conn.execute(f"""
+            DELETE FROM {rollup_table(1)} WHERE bucket >= COALESCE(
+                (SELECT raw_before FROM tests t WHERE t.test_id = {rollup_table(1)}.test_id), bucket)
+        """)
+        for source in sample_sources(conn):
+            conn.execute(ROLLUP_FROM_SAMPLES_SQL.format(source=source, where="""timestamp >= COALESCE(
+                (SELECT raw_before FROM tests t WHERE t.test_id = j.test_id), timestamp)"""))
+    rebuild_coarse_rollups(conn)
+
+def rebuild_test_rollups(conn, test_id):
+    # every tier of one test from its raw samples, inside the caller's transaction;
+    # only valid while the test has no retention horizon
+    for res in ROLLUP_TIERS:
+        conn.execute(f"DELETE FROM {rollup_table(res)} WHERE test_id = ?", (test_id,))
+    conn.execute(ROLLUP_FROM_SAMPLES_SQL.format(source=sample_source(test_id, conn), where="test_id = ?"),
+                 (test_id,))
+    for res in ROLLUP_TIERS[1:]:
+        conn.execute(coarse_rollup_sql(res, "test_id = ?"), (test_id,))
+
+def rebuild_coarse_rollups(conn):
+    # coarser tiers are derived from the per-second tier
+    with conn:
+        for res in ROLLUP_TIERS[1:]:
+            conn.execute(f"DELETE FROM {rollup_table(res)}")
+            conn.execute(coarse_rollup_sql(res))
+
+def pick_resolution(start, end):
+    # explicit ?resolution= wins, otherwise the finest tier that fits MAX_SERIES_POINTS
+    requested = request.args.get("resolution", type=int)
+    if requested in ROLLUP_TIERS:
+        return requested
+    span = end - start + 1
+    for res in ROLLUP_TIERS:
+        if span / res <= MAX_SERIES_POINTS:
+            return res
+    return ROLLUP_TIERS[-1]
+
+def bucket_range(start, end, res):
+    return range(start - start % res, end - end % res + 1, res)
+
+def query_rollup(columns, start, end, test_id=None, by_label=False, res=1):
+    # one GROUP BY pass over a rollup tier for the [start, end] window
+    keys = "label, bucket" if by_label else "bucket"
+    conds = ["bucket BETWEEN ? AND ?"]
+    params = [start - start % res, end]
+    if test_id:
+        conds.append("test_id = ?")
+        params.append(test_id)
+    q = (f"SELECT {keys}, {columns} FROM {rollup_table(res)} "
+         f"WHERE {' AND '.join(conds)} GROUP BY {keys} ORDER BY {keys}")
+    return run_query(q, tuple(params))
+
+def rate_per_second(count, res, seconds=None):
+    # `seconds`: how much of the bucket has elapsed, see bucket_seconds
+    return count if res == 1 else round(count / (seconds or res), 2)
+
+def bucket_seconds(bucket, last_sec, res):
+    # a bucket still filling up (the live edge) only spans the seconds up to its
+    # newest sample so far; closed buckets span all res seconds
+    if res == 1 or last_sec is None or bucket + res <= time.time():
+        return res
+    return last_sec - bucket + 1
+
+def series_window():
+    # window/end/since shared by the time-series endpoints. With ?since= (a cursor
+    # from an earlier response) only buckets from the cursor on are read, since the
+    # client already holds the rest of the window.
+    window = request.args.get("window", default=60, type=int)
+    end = request.args.get("end", type=int) or int(time.time())
+    start = end - window + 1
+    res = pick_resolution(start, end)
+    since = request.args.get("since", type=int)
+    first = start if since is None or since < start else since - since % res
+    return start, end, res, first
+
+def series_cursor(end, res):
+    # first bucket that may still change: seconds newer than STREAM_LAG can
+    # still receive samples from the write-behind queue
+    settled = min(end, int(time.time()) - STREAM_LAG)
+    return settled - settled % res
+
+# --------- Latency sketches and histograms ----------
+# Rollup buckets carry two response-time distributions, both stored as sparse
+# {key: count} maps (encode_counts) that merge by adding counts:
+#
+# hist   - exact histogram keyed on whole milliseconds. JMeter percentiles truncate
+#          samples to int ms, so walking its cumulative counts gives the same
+#          median/p90/p95/p99 as sorting every raw sample. Size grows with the number
+#          of distinct ms values seen.
+# sketch - DDSketch-style log histogram: a sample v > 0 lands in bucket
+#          ceil(log_gamma(v)) with gamma = (1+a)/(1-a), reported as 2*gamma^i/(gamma+1).
+#          Any value read back is within SKETCH_ALPHA relative error of the true
+#          sample at that rank (a=0.01 gives +/-1%, e.g. a true p95 of 850 ms reports
+#          between 841.5 and 858.5 ms), and size stays bounded (~700 buckets cover
+#          1 ms to 17 min).
+SKETCH_ALPHA = 0.01
+_SKETCH_GAMMA = (1 + SKETCH_ALPHA) / (1 - SKETCH_ALPHA)
+_SKETCH_LOG_GAMMA = math.log(_SKETCH_GAMMA)
+_SKETCH_ZERO = -(2 ** 31)     # bucket for response times <= 0
+
+def sketch_index(v):
+    if v <= 0:
+        return _SKETCH_ZERO
+    return math.ceil(math.log(v) / _SKETCH_LOG_GAMMA)
+
+def sketch_value(idx):
+    if idx == _SKETCH_ZERO:
+        return 0.0
+    return 2 * _SKETCH_GAMMA ** idx / (_SKETCH_GAMMA + 1)
+
+def add_counts(into, other):
+    for key, n in other.items():
+        into[key] = into.get(key, 0) + n
+    return into
+
+def encode_counts(counts):
+    # flat int32 pairs (key, count), sorted by key
+    flat = array("i")
+    for key in sorted(counts):
+        flat.append(key)
+        flat.append(counts[key])
+    return flat.tobytes()
+
+def decode_counts(blob):
+    if not blob:
+        return {}
+    flat = array("i")
+    flat.frombytes(blob)
+    return dict(zip(flat[0::2], flat[1::2]))
+
+def counts_merge(a, b):
+    return encode_counts(add_counts(decode_counts(a), decode_counts(b)))
+
+def jmeter_rank(n, percentile):
+    # same rank rule as jmeter_percentile / jmeter_median, 1-based
+    if percentile == 50:
+        rank = math.ceil(n / 2)
+    elif percentile == 90:
+        rank = math.floor((percentile / 100.0) * n)
+    else:
+        rank = math.ceil((percentile / 100.0) * n)
+    return max(1, min(rank, n))
+
+def counts_rank_key(counts, rank):
+    # key holding the rank-th smallest sample
+    seen = 0
+    for key in sorted(counts):
+        seen += counts[key]
+        if seen >= rank:
+            return key
+    return None
+
+def hist_percentile(counts, percentile):
+    n = sum(counts.values())
+    if n == 0:
+        return 0
+    return counts_rank_key(counts, jmeter_rank(n, percentile))
+
+def sketch_percentile(counts, percentile, lo=None, hi=None):
+    n = sum(counts.values())
+    if n == 0:
+        return 0
+    v = sketch_value(counts_rank_key(counts, jmeter_rank(n, percentile)))
+    # exact min/max from the rollup tighten the estimate at the tails
+    if lo is not None:
+        v = max(v, lo)
+    if hi is not None:
+        v = min(v, hi)
+    return int(round(v))
+
+class CountsAggregate:
+    # sketch_agg(response_time) / hist_agg(response_time): build from raw samples
+    key = None
+
+    def __init__(self):
+        self.counts = {}
+
+    def step(self, v):
+        if v is not None:
+            k = self.key(float(v))
+            self.counts[k] = self.counts.get(k, 0) + 1
+
+    def finalize(self):
+        return encode_counts(self.counts)
+
+class SketchAggregate(CountsAggregate):
+    key = staticmethod(sketch_index)
+
+class HistAggregate(CountsAggregate):
+    key = staticmethod(int)
+
+class CountsMergeAggregate:
+    # counts_merge_agg(blob): merge stored sketches or histograms
+    def __init__(self):
+        self.counts = {}
+
+    def step(self, blob):
+        add_counts(self.counts, decode_counts(blob))
+
+    def finalize(self):
+        return encode_counts(self.counts)
+
+def register_sql_functions(conn):
+    conn.create_function("counts_merge", 2, counts_merge, deterministic=True)
+    conn.create_aggregate("sketch_agg", 1, SketchAggregate)
+    conn.create_aggregate("hist_agg", 1, HistAggregate)
+    conn.create_aggregate("counts_merge_agg", 1, CountsMergeAggregate)
+
+# --------- Write-behind ingest queue ----------
+INGEST_QUEUE_MAX = 200000     # samples buffered before /metrics answers 429
+INGEST_BATCH_SIZE = 5000      # writer commits once this many samples are waiting...
+INGEST_FLUSH_INTERVAL = 0.5   # ...or this many seconds after the first one arrived
+INGEST_RETRY_AFTER = 1        # seconds, sent back in Retry-After when the queue is full
+INGEST_WRITE_ATTEMPTS = 5
+
+class IngestQueue:
+    """Bounded in-memory sample buffer drained by one dedicated writer thread."""
+
+    def __init__(self, maxsize, writer):
+        self.maxsize = maxsize
+        self.writer = writer
+        self._rows = collections.deque()
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._offered = 0       # rows ever accepted, in queue order
+        self._done = 0          # rows written or dropped; always a prefix of _offered
+        self._flush_upto = 0    # rows a pending flush() waits for
+        self._thread = None
+        self.stats = {"queued": 0, "written": 0, "rejected": 0, "dropped": 0,
+                      "commits": 0, "write_errors": 0}
+
+    def offer(self, rows):
+        # all-or-nothing so a batch is never half accepted
+        with self._cond:
+            if len(self._rows) + len(rows) > self.maxsize:
+                self.stats["rejected"] += len(rows)
+                return False
+            was_empty = not self._rows
+            self._rows.extend(rows)
+            self._offered += len(rows)
+            self.stats["queued"] += len(rows)
+            # the writer sleeps on an empty queue and starts the group's flush
+            # interval from the first row; a full group commits right away
+            if was_empty or len(self._rows) >= INGEST_BATCH_SIZE:
+                self._cond.notify_all()
+        self._ensure_writer()
+        return True
+
+    def depth(self):
+        with self._cond:
+            return len(self._rows) + self._in_flight
+
+    def flush(self, timeout=None):
+        # block until everything offered before the call is committed; rows offered
+        # meanwhile are not waited for, so steady ingest cannot hold a flush open
+        self._ensure_writer()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            target = self._offered
+            self._flush_upto = max(self._flush_upto, target)
+            self._cond.notify_all()
+            while self._done < target:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def snapshot(self):
+        with self._cond:
+            return dict(self.stats, depth=len(self._rows) + self._in_flight,
+                        capacity=self.maxsize)
+
+    def _ensure_writer(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._cond:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="ingest-writer", daemon=True)
+                self._thread.start()
+
+    def _take_group(self):
+        with self._cond:
+            while not self._rows:
+                self._cond.wait()
+            deadline = time.monotonic() + INGEST_FLUSH_INTERVAL
+            # a flush waiting on rows not yet taken skips the group commit wait
+            while len(self._rows) < INGEST_BATCH_SIZE and self._done >= self._flush_upto:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            n = min(len(self._rows), INGEST_BATCH_SIZE)
+            group = [self._rows.popleft() for _ in range(n)]
+            self._in_flight = n
+            return group
+
+    def _write(self, rows):
+        try:
+            self.writer(rows)
+        except Exception:
+            app.logger.exception("ingest writer failed on %d samples", len(rows))
+            with self._cond:
+                self.stats["write_errors"] += 1
+            return False
+        with self._cond:
+            self.stats["written"] += len(rows)
+            self.stats["commits"] += 1
+        return True
+
+    def _write_split(self, rows):
+        # a group that keeps failing is halved until the rows that cannot be
+        # written are isolated, so they are the only ones dropped
+        if len(rows) == 1:
+            app.logger.error("ingest writer dropped sample %r", rows[0])
+            with self._cond:
+                self.stats["dropped"] += 1
+            return
+        mid = len(rows) // 2
+        for half in (rows[:mid], rows[mid:]):
+            if not self._write(half):
+                self._write_split(half)
+
+    def _run(self):
+        while True:
+            group = self._take_group()
+            for attempt in range(INGEST_WRITE_ATTEMPTS):
+                if self._write(group):
+                    break
+                if attempt + 1 < INGEST_WRITE_ATTEMPTS:
+                    time.sleep(min(2 ** attempt * 0.1, 2))
+            else:
+                self._write_split(group)
+            with self._cond:
+                self._in_flight = 0
+                self._done += len(group)
+                self._cond.notify_all()
+
+INGEST = IngestQueue(INGEST_QUEUE_MAX, write_samples)
+
+@atexit.register
+def _flush_ingest_on_exit():
+    if INGEST.depth():
+        INGEST.flush(timeout=10)
+
+def queue_full_response():
+    resp = jsonify({"status": "busy", "message": "Ingest queue is full, retry later"})
+    resp.status_code = 429
+    resp.headers["Retry-After"] = str(INGEST_RETRY_AFTER)
+    return resp
+
+@app.route("/metrics", methods=["POST"])
+def receive_metrics():
+    data = request.get_json(force=True)
+    if not well_typed_sample(data):
+        return jsonify({"status": "error", "message": "Sample has a field of the wrong type"}), 400
+    if not INGEST.offer([sample_row(data)]):
+        return queue_full_response()
     return jsonify({"status": "ok"})
 
+@app.route("/metrics/batch", methods=["POST"])
+def receive_metrics_batch():
+    items = parse_batch_body(request.get_data())
+    if items is None:
+        return jsonify({"status": "error", "message": "Body must be a JSON array or NDJSON"}), 400
+    rows = [sample_row(d) for d in items if valid_sample(d)]
+    rejected = len(items) - len(rows)
+    if len(rows) > INGEST.maxsize:
+        # could never fit, so a 429 would only send the client into a retry loop
+        return jsonify({"status": "error", "message":
+                        f"Batch of {len(rows)} samples exceeds the ingest queue capacity of "
+                        f"{INGEST.maxsize}; split it into smaller batches"}), 413
+    if rows and not INGEST.offer(rows):
+        return queue_full_response()
+    return jsonify({"status": "ok", "accepted": len(rows), "rejected": rejected})
+
+@app.route("/api/ingest_stats", methods=["GET"])
+def api_ingest_stats():
+    return jsonify(INGEST.snapshot())
+
 # --------- Helper: compute percentiles safely ----------
 def percentile(sorted_list, pct):
     if not sorted_list:
@@ -122,12 +1724,313 @@ def percentile(sorted_list, pct):
     d1 = sorted_list[int(c)] * (k-f)
     return d0 + d1
 
+# --------- Composite dashboard endpoint ----------
+def panel_series(start, end, test_id, res):
+    # tps, threads, error %, per-label tps and per-label avg response time, all
+    # derived from one GROUP BY label, bucket pass over the rollup tier
+    rows = query_rollup("SUM(count), SUM(errors), SUM(sum_threads), SUM(thread_samples), SUM(sum_rt), "
+                        "MAX(last_sec)", start, end, test_id, by_label=True, res=res)
+    timestamps = list(bucket_range(start, end, res))
+    totals = {}
+    per_label = {}
+    last = {}
+    for label, sec, cnt, errs, threads, thread_samples, sum_rt, last_sec in rows:
+        t = totals.setdefault(sec, [0, 0, 0, 0])
+        t[0] += cnt
+        t[1] += errs
+        t[2] += threads
+        t[3] += thread_samples
+        last[sec] = max(last.get(sec, last_sec), last_sec)
+        per_label.setdefault(label, {})[sec] = (cnt, sum_rt)
+    seconds = {sec: bucket_seconds(sec, last_sec, res) for sec, last_sec in last.items()}
+    tps, threads, error_pct = [], [], []
+    for sec in timestamps:
+        cnt, errs, thr, thr_n = totals.get(sec, (0, 0, 0, 0))
+        tps.append(rate_per_second(cnt, res, seconds.get(sec)))
+        threads.append(round(thr * 1.0 / thr_n, 2) if thr_n else 0)
+        error_pct.append(round(errs * 100.0 / cnt, 2) if cnt else 0.0)
+    label_tps = {}
+    response_times = {}
+    for label, by_sec in per_label.items():
+        label_tps[label] = [round(by_sec[sec][0] / seconds[sec], 2) if sec in by_sec else 0.0
+                            for sec in timestamps]
+        response_times[label] = [round(by_sec[sec][1] / by_sec[sec][0], 2) if sec in by_sec else None
+                                 for sec in timestamps]
+    return {"resolution": res, "timestamps": timestamps, "tps": tps, "threads": threads,
+            "error_pct": error_pct, "label_tps": label_tps, "response_times": response_times,
+            "cursor": series_cursor(end, res)}
+
+@app.route("/api/dashboard_state", methods=["GET"])
+@conditional_get(moving=True)
+def api_dashboard_state():
+    # every dashboard panel in one response, computed from one read transaction;
+    # like the single-panel endpoints, series span all tests when no test_id is given
+    series_test_id = request.args.get("test_id")
+    test_id = series_test_id or "default"
+    start = request.args.get("start", type=int)
+    end = request.args.get("end", type=int)
+    _, series_end, res, series_first = series_window()
+    # series=0 skips the charts for clients already fed by /api/stream
+    want_series = request.args.get("series", "1") != "0"
+    with read_snapshot():
+        series = panel_series(series_first, series_end, series_test_id, res) if want_series else None
+        aggregate = aggregate_cached(test_id, start, end, "hist", pick_engine())
+        errors = errors_table(test_id, start, end)
+        success = success_table(test_id, start, end, pick_engine())
+    return jsonify({
+        "test_id": test_id,
+        "generated_at": time.time(),
+        "series": series,
+        "aggregate": sorted(aggregate, key=lambda x: x["count"], reverse=True),
+        "errors": errors,
+        "success": success
+    })
+
+# --------- Live stream ----------
+# /api/stream pushes one frame per closed second instead of clients re-polling
+# whole windows. A second is closed once STREAM_LAG seconds have passed, which
+# leaves the write-behind queue time to flush it into the 1s rollup tier.
+STREAM_LAG = 2
+STREAM_POLL_INTERVAL = 1.0
+STREAM_MAX_CATCHUP = 300      # frames kept per test, i.e. seconds replayed at most on (re)connect
+STREAM_KEEPALIVE = 15
+LIVE_IDLE_EXPIRY = 30         # seconds without a reader before a test's feed is dropped
+
+def second_frames(test_id, first, last):
+    # per-second delta frames for [first, last], one per second even when idle
+    rows = query_rollup("SUM(count), SUM(errors), SUM(sum_threads), SUM(thread_samples), SUM(sum_rt), "
+                        "MAX(max_rt)", first, last, test_id, by_label=True, res=1)
+    frames = {sec: {"ts": sec, "tps": 0, "errors": 0, "error_pct": 0.0, "threads": 0, "labels": {}}
+              for sec in range(first, last + 1)}
+    threads = {}
+    for label, sec, cnt, errs, thr, thr_n, sum_rt, max_rt in rows:
+        f = frames[sec]
+        f["tps"] += cnt
+        f["errors"] += errs
+        t = threads.setdefault(sec, [0, 0])
+        t[0] += thr
+        t[1] += thr_n
+        f["labels"][label] = {"count": cnt, "errors": errs,
+                              "avg_rt": round(sum_rt / cnt, 2) if cnt else None, "max_rt": max_rt}
+    for sec, f in frames.items():
+        if f["tps"]:
+            thr, thr_n = threads[sec]
+            f["threads"] = round(thr * 1.0 / thr_n, 2) if thr_n else 0
+            f["error_pct"] = round(f["errors"] * 100.0 / f["tps"], 2)
+    return [frames[sec] for sec in range(first, last + 1)]
+
+class LiveFeed:
+    __slots__ = ("frames", "cursor", "last_seen")
+
+    def __init__(self, cursor):
+        self.frames = collections.deque(maxlen=STREAM_MAX_CATCHUP)   # (ts, sse bytes, json bytes)
+        self.cursor = cursor
+        self.last_seen = time.monotonic()
+
+class FrameProducer:
+    """Computes each watched test's live frames once per tick for every viewer.
+
+    Stream subscribers and /api/live pollers only read the cached, already
+    serialized frames, so the number of open tabs does not multiply the queries.
+    A test stops being produced after LIVE_IDLE_EXPIRY seconds without readers.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._feeds = {}
+        self._cond = threading.Condition()
+        self._tick = 0
+        self._thread = None
+        self.stats = {"ticks": 0, "frames": 0, "reads": 0, "expired": 0, "errors": 0}
+
+    def frames_since(self, test_id, since=None):
+        # cached frames newer than `since`; the feed is started on first use
+        with self._cond:
+            feed = self._feeds.get(test_id)
+            if feed is None:
+                feed = self._feeds[test_id] = LiveFeed(int(time.time()) - STREAM_LAG - STREAM_MAX_CATCHUP)
+                fresh = True
+            else:
+                fresh = False
+            feed.last_seen = time.monotonic()
+            self.stats["reads"] += 1
+        if fresh:
+            self._ensure_producer()
+            self.wait(self.current_tick(), self.interval * 5)
+        with self._cond:
+            frames = list(feed.frames)
+        if since is None:
+            return frames[-1:]
+        return [f for f in frames if f[0] > since]
+
+    def wait(self, tick, timeout):
+        # block until the producer finishes a tick after `tick`; False on timeout
+        with self._cond:
+            return self._cond.wait_for(lambda: self._tick > tick, timeout)
+
+    def current_tick(self):
+        with self._cond:
+            return self._tick
+
+    def snapshot(self):
+        with self._cond:
+            return dict(self.stats, feeds=len(self._feeds))
+
+    def _ensure_producer(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._cond:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="frame-producer", daemon=True)
+                self._thread.start()
+
+    def _produce(self):
+        closed = int(time.time()) - STREAM_LAG
+        expire_before = time.monotonic() - LIVE_IDLE_EXPIRY
+        with self._cond:
+            for test_id in [t for t, f in self._feeds.items() if f.last_seen < expire_before]:
+                del self._feeds[test_id]
+                self.stats["expired"] += 1
+            feeds = list(self._feeds.items())
+        for test_id, feed in feeds:
+            if closed <= feed.cursor:
+                continue
+            out = []
+            for frame in second_frames(test_id, feed.cursor + 1, closed):
+                body = json.dumps(frame, separators=(",", ":")).encode()
+                out.append((frame["ts"], b"id: %d\ndata: %s\n\n" % (frame["ts"], body), body))
+            with self._cond:
+                feed.frames.extend(out)
+                feed.cursor = closed
+                self.stats["frames"] += len(out)
+
+    def _run(self):
+        while True:
+            started = time.monotonic()
+            try:
+                self._produce()
+            except Exception:
+                self.stats["errors"] += 1
+                app.logger.exception("live frame producer failed")
+            with self._cond:
+                self._tick += 1
+                self.stats["ticks"] += 1
+                self._cond.notify_all()
+                if not self._feeds:
+                    # nobody is watching; the next reader restarts the thread
+                    self._thread = None
+                    return
+            time.sleep(max(0.0, self.interval - (time.monotonic() - started)))
+
+LIVE_FRAMES = FrameProducer(STREAM_POLL_INTERVAL)
+
+@app.route("/api/stream", methods=["GET"])
+def api_stream():
+    test_id = request.args.get("test_id")
+    # resume after the last frame the browser saw (EventSource resends it as
+    # Last-Event-ID on reconnect), else after ?since=, else from now
+    since = request.headers.get("Last-Event-ID", type=int) or request.args.get("since", type=int)
+    if since is None:
+        since = int(time.time()) - STREAM_LAG
+
+    def generate():
+        cursor = since
+        yield f"retry: {int(STREAM_POLL_INTERVAL * 2000)}\n\n".encode()
+        while True:
+            tick = LIVE_FRAMES.current_tick()
+            frames = LIVE_FRAMES.frames_since(test_id, cursor)
+            if frames:
+                yield b"".join(f[1] for f in frames)
+                cursor = frames[-1][0]
+            if not LIVE_FRAMES.wait(tick, STREAM_KEEPALIVE):
+                yield b": keepalive\n\n"
+
+    return Response(stream_with_context(generate()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route("/api/live", methods=["GET"])
+def api_live():
+    # polling twin of /api/stream: frames after ?since= (or just the latest),
+    # spliced together from the cached bytes without re-encoding
+    frames = LIVE_FRAMES.frames_since(request.args.get("test_id"), request.args.get("since", type=int))
+    cursor = frames[-1][0] if frames else request.args.get("since", type=int)
+    body = b'{"cursor":%s,"frames":[%s]}' % (json.dumps(cursor).encode(), b",".join(f[2] for f in frames))
+    return Response(body, mimetype="application/json")
+
+@app.route("/api/live_stats", methods=["GET"])
+def api_live_stats():
+    return jsonify(LIVE_FRAMES.snapshot())
+
 # --------- Aggregate endpoint ----------
 @app.route("/api/aggregate", methods=["GET"])
+@conditional_get("default")
 def api_aggregate():
     test_id = request.args.get("test_id", "default")
     start = request.args.get("start", type=int)
     end = request.args.get("end", type=int)
+    # percentiles: hist (default, exact from rollup histograms), sketch (approximate,
+    # bounded size) or raw (sorts every sample; also ?exact=1)
+    method = request.args.get("percentiles", "hist")
+    if method == "raw" or request.args.get("exact", type=int):
+        method = "raw"
+    res = aggregate_cached(test_id, start, end, method, pick_engine())
+    res = sorted(res, key=lambda x: x["count"], reverse=True)
+    return jsonify(res)
+
+def aligned_resolution(start, end):
+    # coarsest tier whose bucket edges line up with the requested window
+    for res in reversed(ROLLUP_TIERS):
+        if (not start or start % res == 0) and (not end or (end + 1) % res == 0):
+            return res
+    return 1
+
+def aggregate_from_rollups(test_id, start, end, use_sketch=False):
+    res = aligned_resolution(start, end)
+    conds = ["test_id = ?"]
+    params = [test_id]
+    if start:
+        conds.append("bucket >= ?")
+        params.append(start)
+    if end:
+        conds.append("bucket <= ?")
+        params.append(end)
+    where = " AND ".join(conds)
+    rows = run_query(f"""
+        SELECT label, SUM(count), SUM(errors), SUM(sum_rt), MIN(min_rt), MAX(max_rt),
+               SUM(sum_recv), SUM(sum_sent), MIN(first_sec), MAX(last_sec),
+               counts_merge_agg({"sketch" if use_sketch else "hist"})
+        FROM {rollup_table(res)}
+        WHERE {where}
+        GROUP BY label
+    """, tuple(params))
+
+    out = []
+    for lab, count, errors, sum_rt, mn, mx, recv, sent, first, last, blob in rows:
+        counts = decode_counts(blob)
+        if use_sketch:
+            pct = lambda p: sketch_percentile(counts, p, mn, mx)
+        else:
+            pct = lambda p: hist_percentile(counts, p)
+        duration = (last - first + 1) if first is not None else 1
+        out.append({
+            "test_id": test_id,
+            "label": lab,
+            "count": count,
+            "avg": round(sum_rt/count, 2) if count else 0,
+            "median": pct(50),
+            "min": mn if mn is not None else 0,
+            "max": mx if mx is not None else 0,
+            "pct90": pct(90),
+            "pct95": pct(95),
+            "pct99": pct(99),
+            "error_pct": round((errors/count)*100,2) if count else 0,
+            "throughput": round(count / duration, 5) if duration > 0 else 0,
+            "received_kb_sec": round((recv / 1024) / duration, 2) if duration > 0 else 0,
+            "sent_kb_sec": round((sent / 1024) / duration, 2) if duration > 0 else 0
+        })
+    return out
+
+def aggregate_exact(test_id, start, end, engine="python"):
     conds = ["test_id = ?"]
     params = [test_id]
     if start:
@@ -137,7 +2040,9 @@ def api_aggregate():
         conds.append("timestamp <= ?")
         params.append(end)
     where = " AND ".join(conds)
-    q = f"SELECT label, response_time, success, received_bytes, sent_bytes, timestamp FROM jmeter_samples WHERE {where}"
+    if engine == "numpy":
+        return aggregate_numpy(test_id, where, tuple(params))
+    q = f"SELECT label, response_time, success, received_bytes, sent_bytes, timestamp FROM {sample_source(test_id)} WHERE {where}"
     rows = run_query(q, tuple(params))
     # print("Aggregate query:", q, params, "Rows:", len(rows))  # Debug
 
@@ -145,24 +2050,30 @@ def api_aggregate():
     for lab, rt, succ, recv, sent, ts in rows:
         if lab not in agg:
             agg[lab] = {
+                "count": 0,
                 "samples": [],
                 "errors": 0,
                 "received_bytes": 0,
                 "sent_bytes": 0,
                 "timestamps": []
             }
-        agg[lab]["samples"].append(rt)
+        # samples without a response time or timestamp count, but stay out of
+        # the statistics they have no value for (as in rollup_buckets)
+        agg[lab]["count"] += 1
+        if rt is not None:
+            agg[lab]["samples"].append(rt)
         agg[lab]["received_bytes"] += recv if recv else 0
         agg[lab]["sent_bytes"] += sent if sent else 0
-        agg[lab]["timestamps"].append(ts)
+        if ts is not None:
+            agg[lab]["timestamps"].append(ts)
         if succ == 0:
             agg[lab]["errors"] += 1
     
     res = []
     for lab, d in agg.items():
         s = sorted(d["samples"])
-        count = len(s)
-        avg = round(sum(s)/count, 2) if count else 0
+        count = d["count"]
+        avg = round(sum(s)/len(s), 2) if s else 0
         mn = s[0] if s else 0
         mx = s[-1] if s else 0
         median=jmeter_median(s)
@@ -193,8 +2104,7 @@ def api_aggregate():
             "received_kb_sec": received_kb_sec,
             "sent_kb_sec": sent_kb_sec
         })
-    res = sorted(res, key=lambda x: x["count"], reverse=True)
-    return jsonify(res)
+    return res
 
 
     test_id = request.args.get("test_id", "default")
@@ -213,7 +2123,7 @@ def api_aggregate():
     where = " AND ".join(conds)
     q = f"""
         SELECT label, response_time, success, received_bytes, sent_bytes, timestamp
-        FROM jmeter_samples
+        FROM {sample_source(test_id)}
         WHERE {where}
     """
     rows = run_query(q, tuple(params))
@@ -222,6 +2132,7 @@ def api_aggregate():
     for lab, rt, succ, recv, sent, ts in rows:
         if lab not in agg:
             agg[lab] = {
+                "count": 0,
                 "samples": [],
                 "errors": 0,
                 "received_bytes": 0,
@@ -289,69 +2200,60 @@ def api_aggregate():
 
 # --------- TPS per second endpoint ----------
 @app.route("/api/tps", methods=["GET"])
+@conditional_get(moving=True)
 def api_tps():
-    window = request.args.get("window", default=60, type=int)
-    end = request.args.get("end", type=int) or int(time.time())
-    start = end - window + 1
+    start, end, res, first = series_window()
     test_id = request.args.get("test_id")
-    if test_id:
-        rows = run_query("SELECT timestamp, COUNT(*) FROM jmeter_samples WHERE timestamp BETWEEN ? AND ? AND test_id=? GROUP BY timestamp ORDER BY timestamp ASC", (start, end, test_id))
-    else:
-        rows = run_query("SELECT timestamp, COUNT(*) FROM jmeter_samples WHERE timestamp BETWEEN ? AND ? GROUP BY timestamp ORDER BY timestamp ASC", (start, end))
-    ts_map = {r[0]: r[1] for r in rows}
+    rows = query_rollup("SUM(count), MAX(last_sec)", first, end, test_id, res=res)
+    ts_map = {r[0]: rate_per_second(r[1], res, bucket_seconds(r[0], r[2], res)) for r in rows}
     labels = []
     values = []
-    for sec in range(start, end+1):
+    for sec in bucket_range(first, end, res):
         labels.append(sec)
         values.append(ts_map.get(sec, 0))
     return jsonify({
         "timestamps": labels,
-        "tps": values
+        "tps": values,
+        "resolution": res,
+        "cursor": series_cursor(end, res)
     })
 
 # --------- Thread counts over time ----------
 @app.route("/api/threads", methods=["GET"])
+@conditional_get(moving=True)
 def api_threads():
     # average thread_count per second in window
-    window = request.args.get("window", default=60, type=int)
-    end = request.args.get("end", type=int) or int(time.time())
-    start = end - window + 1
+    start, end, res, first = series_window()
     test_id = request.args.get("test_id")
+    rows = query_rollup("SUM(sum_threads) * 1.0 / SUM(thread_samples)", first, end, test_id, res=res)
 
-    if test_id:
-        rows = run_query("""
-            SELECT timestamp, AVG(thread_count)
-            FROM jmeter_samples
-            WHERE timestamp BETWEEN ? AND ? AND test_id = ?
-            GROUP BY timestamp ORDER BY timestamp ASC
-        """, (start, end, test_id))
-    else:
-        rows = run_query("""
-            SELECT timestamp, AVG(thread_count)
-            FROM jmeter_samples
-            WHERE timestamp BETWEEN ? AND ?
-            GROUP BY timestamp ORDER BY timestamp ASC
-        """, (start, end))
-
-    ts_map = {r[0]: round(r[1], 2) for r in rows}
+    ts_map = {r[0]: round(r[1], 2) for r in rows if r[1] is not None}
     labels = []
     values = []
-    for sec in range(start, end + 1):
+    for sec in bucket_range(first, end, res):
         labels.append(sec)
         values.append(ts_map.get(sec, 0))
 
-    return jsonify({"timestamps": labels, "threads": values})
+    return jsonify({"timestamps": labels, "threads": values, "resolution": res,
+                    "cursor": series_cursor(end, res)})
 
 
 # --------- Errors table endpoint ----------
 @app.route("/api/errors", methods=["GET"])
+@conditional_get("default")
 def api_errors():
     start = request.args.get("start", type=int)
     end = request.args.get("end", type=int)
     test_id = request.args.get("test_id", "default")
-    q = """
+    return jsonify(errors_table(test_id, start, end))
+
+def errors_table(test_id, start, end):
+    frozen = frozen_summary(test_id, "errors", start, end)
+    if frozen is not None:
+        return frozen
+    q = f"""
     SELECT label, status_code, COUNT(*), GROUP_CONCAT(DISTINCT error_message)
-    FROM jmeter_samples
+    FROM {sample_source(test_id)}
     WHERE success=0 AND test_id=?
     """
     conds = []
@@ -365,16 +2267,26 @@ def api_errors():
     q += " GROUP BY label, status_code ORDER BY COUNT(*) DESC"
     rows = run_query(q, tuple(params))
     result = [{"label": r[0], "status": r[1], "count": r[2], "message": r[3] or ""} for r in rows]
-    return jsonify(result)
+    return result
 
 @app.route("/api/success", methods=["GET"])
+@conditional_get("default")
 def api_success():
     start = request.args.get("start", type=int)
     end = request.args.get("end", type=int)
     test_id = request.args.get("test_id", "default")
-    q = """
+    return jsonify(success_table(test_id, start, end, pick_engine()))
+
+def success_table(test_id, start, end, engine="python"):
+    frozen = frozen_summary(test_id, "success", start, end)
+    if frozen is not None:
+        return frozen
+    if raw_compacted(test_id, start):
+        return success_from_rollups(test_id, start, end)
+    # samples without a response time are left out, as in the rollup histograms
+    q = f"""
     SELECT label, response_time
-    FROM jmeter_samples WHERE success=1 AND test_id=?
+    FROM {sample_source(test_id)} WHERE success=1 AND test_id=? AND response_time IS NOT NULL
     """
     conds = []
     params = [test_id]
@@ -385,6 +2297,8 @@ def api_success():
     if conds:
         q += " AND " + " AND ".join(conds)
     rows = run_query(q, tuple(params))
+    if engine == "numpy":
+        return success_numpy(rows)
     # Group by label
     label_map = {}
     for r in rows:
@@ -401,7 +2315,558 @@ def api_success():
         mx = max(samples) if samples else 0
         p90 = jmeter_percentile(samples, 90) if samples else 0
         result.append({"label": label, "count": count, "avg": avg, "min": mn, "max": mx, "p90": p90})
-    return jsonify(result)
+    return result
+
+def success_from_rollups(test_id, start, end):
+    # once successful samples were compacted: the rollup histograms count every
+    # sample, and the failed ones, still kept raw, are taken back out
+    res = aligned_resolution(start, end)
+    conds = ["test_id = ?"]
+    params = [test_id]
+    if start:
+        conds.append("bucket >= ?")
+        params.append(start)
+    if end:
+        conds.append("bucket <= ?")
+        params.append(end)
+    rows = run_query(f"""
+        SELECT label, SUM(count), SUM(sum_rt), counts_merge_agg(hist)
+        FROM {rollup_table(res)} WHERE {" AND ".join(conds)} GROUP BY label
+    """, tuple(params))
+    labels = {lab: [count, sum_rt, decode_counts(blob)] for lab, count, sum_rt, blob in rows}
+    conds = ["success = 0", "test_id = ?"]
+    params = [test_id]
+    if start:
+        conds.append("timestamp >= ?"); params.append(start)
+    if end:
+        conds.append("timestamp <= ?"); params.append(end)
+    for lab, rt in run_query(f"SELECT label, response_time FROM {sample_source(test_id)} WHERE {' AND '.join(conds)}",
+                             tuple(params)):
+        st = labels.get(lab or "")
+        if st is None:
+            continue
+        st[0] -= 1
+        if rt is not None:
+            st[1] -= rt
+            st[2][int(rt)] -= 1
+    result = []
+    for label, (count, sum_rt, counts) in labels.items():
+        counts = {k: v for k, v in counts.items() if v > 0}
+        if not count or not counts:
+            continue
+        result.append({"label": label, "count": count, "avg": round(sum_rt/count, 2),
+                       "min": min(counts), "max": max(counts), "p90": hist_percentile(counts, 90)})
+    return result
+
+# --------- NumPy columnar engine ----------
+# Vectorized twin of the exact (raw sample) paths in api_aggregate and api_success.
+# Columns are pulled into arrays, rows are grouped by label with one stable argsort,
+# and each label's order statistics come from a single np.partition at JMeter's ranks
+# (jmeter_rank), so results match the pure-Python path value for value.
+AGGREGATE_ENGINE = "numpy"    # "numpy" or "python"; ?engine= overrides per request
+
+def pick_engine():
+    engine = request.args.get("engine", AGGREGATE_ENGINE)
+    return "numpy" if engine == "numpy" and np is not None else "python"
+
+AGGREGATE_DTYPE = [("label", "O"), ("rt", "f8"), ("success", "i8"),
+                   ("recv", "f8"), ("sent", "f8"), ("ts", "f8")]   # NULL rt/ts become NaN
+
+def label_groups(labels):
+    # label codes in first-seen order (keeps the Python path's tie ordering),
+    # plus the permutation that groups rows by code and each group's bounds
+    codes = {}
+    inv = np.array([codes.setdefault(lab, len(codes)) for lab in labels], dtype=np.intp)
+    order = np.argsort(inv, kind="stable")
+    bounds = np.concatenate(([0], np.cumsum(np.bincount(inv, minlength=len(codes)))))
+    return list(codes), inv, order, bounds
+
+def order_stats(values, percentiles):
+    # min, max and the JMeter-rank order statistic for each percentile
+    n = len(values)
+    kth = sorted({0, n - 1, *(jmeter_rank(n, p) - 1 for p in percentiles)})
+    part = np.partition(values, kth)
+    return part[0], part[n - 1], [part[jmeter_rank(n, p) - 1] for p in percentiles]
+
+def aggregate_numpy(test_id, where, params):
+    # NULLs are folded in SQL the same way the Python loop treats them
+    rows = run_query(f"""
+        SELECT label, response_time, COALESCE(success, 1), COALESCE(received_bytes, 0),
+               COALESCE(sent_bytes, 0), timestamp
+        FROM {sample_source(test_id)} WHERE {where}
+    """, params)
+    if not rows:
+        return []
+    cols = np.fromiter(rows, dtype=AGGREGATE_DTYPE, count=len(rows))
+    del rows
+    names, inv, order, bounds = label_groups(cols["label"].tolist())
+    rt = cols["rt"][order]
+    ts = cols["ts"][order]
+    k = len(names)
+    errors = np.bincount(inv, weights=(cols["success"] == 0), minlength=k)
+    recv_sum = np.bincount(inv, weights=cols["recv"], minlength=k)
+    sent_sum = np.bincount(inv, weights=cols["sent"], minlength=k)
+    res = []
+    for i, lab in enumerate(names):
+        lo, hi = bounds[i], bounds[i + 1]
+        s = rt[lo:hi]
+        s = s[~np.isnan(s)]
+        count = int(hi - lo)
+        if len(s):
+            mn, mx, (median, p90, p95, p99) = order_stats(s, (50, 90, 95, 99))
+        else:
+            mn = mx = median = p90 = p95 = p99 = 0
+        err_pct = round((int(errors[i]) / count) * 100, 2)
+        t = ts[lo:hi]
+        t = t[~np.isnan(t)]
+        duration = int(t.max() - t.min() + 1) if len(t) else 1
+        res.append({
+            "test_id": test_id,
+            "label": lab,
+            "count": count,
+            "avg": round(float(s.sum()) / len(s), 2) if len(s) else 0,
+            "median": float(median),
+            "min": float(mn),
+            "max": float(mx),
+            "pct90": int(p90),
+            "pct95": int(p95),
+            "pct99": int(p99),
+            "error_pct": err_pct,
+            "throughput": round(count / duration, 5) if duration > 0 else 0,
+            "received_kb_sec": round((float(recv_sum[i]) / 1024) / duration, 2) if duration > 0 else 0,
+            "sent_kb_sec": round((float(sent_sum[i]) / 1024) / duration, 2) if duration > 0 else 0
+        })
+    return res
+
+def success_numpy(rows):
+    if not rows:
+        return []
+    cols = np.fromiter(rows, dtype=[("label", "O"), ("rt", "f8")], count=len(rows))
+    names, _inv, order, bounds = label_groups(cols["label"].tolist())
+    rt = cols["rt"][order]
+    result = []
+    for i, label in enumerate(names):
+        s = rt[bounds[i]:bounds[i + 1]]
+        count = len(s)
+        mn, mx, (p90,) = order_stats(s, (90,))
+        result.append({"label": label, "count": count, "avg": round(float(s.sum()) / count, 2),
+                       "min": float(mn), "max": float(mx), "p90": int(p90)})
+    return result
+
+# --------- Incremental aggregate cache ----------
+# Live-edge aggregate requests (no end, or an end at/after the newest second ingested
+# for the test) keep per-label running state plus the last processed row id, so each
+# call only reads rows with id > watermark. Ids come from AUTOINCREMENT and are only
+# ever assigned by the single ingest writer, so they never go backwards. Windows that
+# end before the live edge are answered from a result cache; samples still queued or
+# arriving late can land in them, so ingest drops the ones its rows fall into
+# (invalidate_closed_windows).
+AGGREGATE_INCREMENTAL = True
+AGG_STATE_MAX = 32            # open-ended (test_id, start) states kept
+AGG_RESULT_CACHE_MAX = 256    # closed-window results kept
+
+class LabelState:
+    __slots__ = ("count", "errors", "sum_rt", "recv", "sent", "min_ts", "max_ts", "values")
+
+    def __init__(self):
+        self.count = self.errors = 0
+        self.sum_rt = self.recv = self.sent = 0
+        self.min_ts = self.max_ts = None
+        self.values = {}          # response_time -> count, exact
+
+    def add(self, rt, succ, recv, sent, ts):
+        # like rollup_buckets, a sample without a response time or timestamp still
+        # counts but stays out of the statistics it has no value for
+        self.count += 1
+        if rt is not None:
+            self.sum_rt += rt
+            self.values[rt] = self.values.get(rt, 0) + 1
+        self.recv += recv if recv else 0
+        self.sent += sent if sent else 0
+        if succ == 0:
+            self.errors += 1
+        if ts is not None:
+            if self.min_ts is None or ts < self.min_ts:
+                self.min_ts = ts
+            if self.max_ts is None or ts > self.max_ts:
+                self.max_ts = ts
+
+    def merge(self, other):
+        self.count += other.count
+        self.errors += other.errors
+        self.sum_rt += other.sum_rt
+        self.recv += other.recv
+        self.sent += other.sent
+        add_counts(self.values, other.values)
+        if other.min_ts is not None and (self.min_ts is None or other.min_ts < self.min_ts):
+            self.min_ts = other.min_ts
+        if other.max_ts is not None and (self.max_ts is None or other.max_ts > self.max_ts):
+            self.max_ts = other.max_ts
+
+class AggregateState:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.watermark = 0
+        self.max_ts = None
+        self.labels = {}
+
+    def consume(self, rows):
+        # rows are folded into fresh per-label state first and merged in at the end,
+        # so a batch that fails part way leaves the state and watermark untouched
+        fresh = {}
+        for row_id, lab, rt, succ, recv, sent, ts in rows:
+            st = fresh.get(lab)
+            if st is None:
+                st = fresh[lab] = LabelState()
+            st.add(rt, succ, recv, sent, ts)
+        if not rows:
+            return
+        for lab, st in fresh.items():
+            self.labels.setdefault(lab, LabelState()).merge(st)
+            if st.max_ts is not None and (self.max_ts is None or st.max_ts > self.max_ts):
+                self.max_ts = st.max_ts
+        self.watermark = rows[-1][0]
+
+    def result(self, test_id):
+        res = []
+        for lab, st in self.labels.items():
+            count = st.count
+            timed = sum(st.values.values())   # samples with a response time
+            duration = st.max_ts - st.min_ts + 1 if st.min_ts is not None else 1
+            rank_key = lambda p: counts_rank_key(st.values, jmeter_rank(timed, p)) if timed else 0
+            res.append({
+                "test_id": test_id,
+                "label": lab,
+                "count": count,
+                "avg": round(st.sum_rt/timed, 2) if timed else 0,
+                "median": rank_key(50),
+                "min": min(st.values) if timed else 0,
+                "max": max(st.values) if timed else 0,
+                "pct90": int(rank_key(90)),
+                "pct95": int(rank_key(95)),
+                "pct99": int(rank_key(99)),
+                "error_pct": round((st.errors/count)*100, 2),
+                "throughput": round(count / duration, 5) if duration > 0 else 0,
+                "received_kb_sec": round((st.recv / 1024) / duration, 2) if duration > 0 else 0,
+                "sent_kb_sec": round((st.sent / 1024) / duration, 2) if duration > 0 else 0
+            })
+        return res
+
+_agg_states = collections.OrderedDict()
+_agg_results = collections.OrderedDict()
+_agg_lock = threading.Lock()
+
+def lru_get(cache, key):
+    with _agg_lock:
+        value = cache.get(key)
+        if value is not None:
+            cache.move_to_end(key)
+        return value
+
+def lru_put(cache, key, value, limit, valid=None):
+    # keeps an existing entry if another request stored one first; `valid` is checked
+    # under the lock, and a value it rejects is returned without being stored
+    with _agg_lock:
+        if valid is not None and not valid():
+            return value
+        value = cache.setdefault(key, value)
+        cache.move_to_end(key)
+        if len(cache) > limit:
+            cache.popitem(last=False)
+        return value
+
+def invalidate_aggregate_cache(test_id):
+    with _agg_lock:
+        for cache in (_agg_states, _agg_results):
+            for key in [k for k in cache if k[0] == test_id]:
+                del cache[key]
+
+def invalidate_closed_windows(touched):
+    # touched: {test_id: oldest timestamp written}; runs after RESULT_CACHE.invalidate,
+    # whose log lets in-flight computations notice the write (see aggregate_cached)
+    with _agg_lock:
+        for key in [k for k in _agg_results if k[0] in touched and k[2] >= touched[k[0]]]:
+            del _agg_results[key]
+
+def live_edge(test_id):
+    # newest second with samples for the test, from the per-second rollup
+    return run_query(f"SELECT MAX(bucket) FROM {rollup_table(1)} WHERE test_id = ?",
+                     (test_id,))[0][0]
+
+def aggregate_cached(test_id, start, end, method, engine):
+    frozen = frozen_summary(test_id, f"aggregate:{method}", start, end)
+    if frozen is not None:
+        return frozen
+    if method == "raw" and raw_compacted(test_id, start):
+        method = "hist"   # the window reaches back past the retention horizon
+    if method != "raw":
+        compute = lambda: aggregate_from_rollups(test_id, start, end, method == "sketch")
+    else:
+        compute = lambda: aggregate_exact(test_id, start, end, engine)
+    if not AGGREGATE_INCREMENTAL:
+        return compute()
+    edge = live_edge(test_id)
+    if end and edge is not None and end < edge:
+        key = (test_id, start, end, method)
+        cached = lru_get(_agg_results, key)
+        if cached is None:
+            token = RESULT_CACHE.token()
+            cached = lru_put(_agg_results, key, compute(), AGG_RESULT_CACHE_MAX,
+                             valid=lambda: RESULT_CACHE.unchanged(token, test_id, end))
+        return [dict(r) for r in cached]
+    if method != "raw":
+        return compute()  # rollup paths are already proportional to the window
+    return aggregate_incremental(test_id, start, end) or compute()
+
+def aggregate_incremental(test_id, start, end):
+    key = (test_id, start)
+    state = lru_get(_agg_states, key) or lru_put(_agg_states, key, AggregateState(), AGG_STATE_MAX)
+    with state.lock:
+        conds = ["test_id = ?", "id > ?"]
+        params = [test_id, state.watermark]
+        if start:
+            conds.append("timestamp >= ?")
+            params.append(start)
+        rows = run_query(f"""
+            SELECT id, label, response_time, success, received_bytes, sent_bytes, timestamp
+            FROM {sample_source(test_id)} WHERE {" AND ".join(conds)} ORDER BY id
+        """, tuple(params))
+        state.consume(rows)
+        if end and state.max_ts is not None and state.max_ts > end:
+            return None  # rows past the requested end already folded in
+        return state.result(test_id)
+
+# --------- Test lifecycle ----------
+# A test is active while samples arrive. Once finalized (POST /api/finalize_testid,
+# or automatically after TEST_IDLE_FINALIZE seconds without samples) its full-range
+# aggregate, errors and success tables are stored as JSON in test_summaries, and
+# those requests become one primary-key read. Time series already come from the
+# rollup tiers. A new sample reopens the test and drops its summaries.
+TEST_IDLE_FINALIZE = 300          # seconds without samples; 0 disables auto-finalize
+FINALIZE_CHECK_INTERVAL = 30
+SUMMARY_AGGREGATE_METHODS = ("hist", "raw")
+
+def mark_tests_active(conn, test_ids):
+    # runs inside the ingest transaction
+    now = time.time()
+    ids = [(t,) for t in test_ids if t is not None]
+    conn.executemany("""
+        INSERT INTO test_state (test_id, status, last_ingest) VALUES (?, 'active', ?)
+        ON CONFLICT(test_id) DO UPDATE SET status = 'active', last_ingest = excluded.last_ingest,
+                                           finalized_at = NULL
+    """, [(t, now) for (t,) in ids])
+    conn.executemany("DELETE FROM test_summaries WHERE test_id = ?", ids)
+
+def frozen_summary(test_id, kind, start=None, end=None):
+    # only full-range requests are materialized
+    if start or end:
+        return None
+    rows = run_query("SELECT body FROM test_summaries WHERE test_id = ? AND kind = ?", (test_id, kind))
+    return json.loads(rows[0][0]) if rows else None
+
+def finalize_test(test_id):
+    # returns 'finalized', 'already', 'unknown' or 'busy' (a sample arrived meanwhile)
+    rows = run_query("SELECT status, last_ingest FROM test_state WHERE test_id = ?", (test_id,))
+    if not rows:
+        return "unknown"
+    status, seen = rows[0]
+    if status == "finalized":
+        return "already"
+    engine = "numpy" if AGGREGATE_ENGINE == "numpy" and np is not None else "python"
+    builders = {f"aggregate:{m}": functools.partial(aggregate_cached, test_id, None, None, m, engine)
+                for m in SUMMARY_AGGREGATE_METHODS}
+    builders["errors"] = functools.partial(errors_table, test_id, None, None)
+    builders["success"] = functools.partial(success_table, test_id, None, None, engine)
+    summaries = {}
+    with read_snapshot():
+        for kind, build in builders.items():
+            # a summary that fails is left out; its requests keep computing live
+            try:
+                summaries[kind] = build()
+            except Exception:
+                app.logger.exception("could not freeze %s for test %s", kind, test_id)
+    with db_pool().writer() as conn:
+        with conn:
+            cur = conn.execute("""
+                UPDATE test_state SET status = 'finalized', finalized_at = ?
+                WHERE test_id = ? AND status = 'active' AND last_ingest IS ?
+            """, (time.time(), test_id, seen))
+            if cur.rowcount == 0:
+                return "busy"
+            conn.executemany("INSERT OR REPLACE INTO test_summaries (test_id, kind, body) VALUES (?, ?, ?)",
+                             [(test_id, kind, json.dumps(body)) for kind, body in summaries.items()])
+    invalidate_aggregate_cache(test_id)   # the incremental state is no longer needed
+    return "finalized"
+
+def finalize_idle_tests():
+    cutoff = time.time() - TEST_IDLE_FINALIZE
+    for (test_id,) in run_query("SELECT test_id FROM test_state WHERE status = 'active' AND last_ingest < ?",
+                                (cutoff,)):
+        try:
+            finalize_test(test_id)
+        except Exception:
+            app.logger.exception("auto-finalize of test %s failed", test_id)
+
+def run_finalizer():
+    while True:
+        time.sleep(FINALIZE_CHECK_INTERVAL)
+        if not TEST_IDLE_FINALIZE:
+            continue
+        try:
+            finalize_idle_tests()
+        except Exception:
+            app.logger.exception("auto-finalize failed")
+
+_finalizer = None
+
+def start_finalizer():
+    global _finalizer
+    if _finalizer is None or not _finalizer.is_alive():
+        _finalizer = threading.Thread(target=run_finalizer, name="test-finalizer", daemon=True)
+        _finalizer.start()
+
+@app.route("/api/finalize_testid", methods=["POST"])
+def finalize_testid():
+    data = request.get_json()
+    test_id = data.get("test_id")
+    if not test_id:
+        return jsonify({"message": "No test_id provided"}), 400
+    INGEST.flush(timeout=10)   # samples still queued belong to the test
+    result = finalize_test(test_id)
+    if result == "unknown":
+        return jsonify({"message": f"Unknown test_id '{test_id}'"}), 404
+    if result == "busy":
+        return jsonify({"message": f"test_id '{test_id}' received samples while finalizing, try again"}), 409
+    return jsonify({"message": f"test_id '{test_id}' finalized.", "status": result})
+
+@app.route("/api/test_states", methods=["GET"])
+def api_test_states():
+    rows = run_query("SELECT test_id, status, last_ingest, finalized_at FROM test_state ORDER BY test_id")
+    return jsonify([{"test_id": r[0], "status": r[1], "last_ingest": r[2], "finalized_at": r[3]} for r in rows])
+
+# --------- Test catalog ----------
+# tests / labels / test_labels answer "which tests, which labels" without a
+# DISTINCT scan of jmeter_samples. Ingest folds each group commit into them;
+# rebuild_catalog recomputes them from the raw samples. Tests with a delete job
+# pending are left out of the listings (NOT_DELETING, a WHERE term on tests).
+NOT_DELETING = "test_id NOT IN (SELECT test_id FROM test_state WHERE status = 'deleting')"
+
+def update_catalog(conn, rows):
+    # runs inside the ingest transaction
+    per_test = {}
+    per_label = {}
+    for ts, label, _rt, succ, *_rest, test_id in rows:
+        if test_id is None:
+            continue
+        t = per_test.get(test_id)
+        if t is None:
+            t = per_test[test_id] = [None, None, 0, 0]
+        try:
+            sec = int(float(ts))
+            t[0] = sec if t[0] is None else min(t[0], sec)
+            t[1] = sec if t[1] is None else max(t[1], sec)
+        except (TypeError, ValueError):
+            pass
+        t[2] += 1
+        if as_number(succ, 1) == 0:
+            t[3] += 1
+        if label is not None:
+            per_label[(test_id, label)] = per_label.get((test_id, label), 0) + 1
+    conn.executemany("""
+        INSERT INTO tests (test_id, first_ts, last_ts, samples, errors) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(test_id) DO UPDATE SET
+            first_ts = MIN(COALESCE(first_ts, excluded.first_ts), COALESCE(excluded.first_ts, first_ts)),
+            last_ts = MAX(COALESCE(last_ts, excluded.last_ts), COALESCE(excluded.last_ts, last_ts)),
+            samples = samples + excluded.samples,
+            errors = errors + excluded.errors
+    """, [(test_id, *t) for test_id, t in per_test.items()])
+    conn.executemany("INSERT OR IGNORE INTO labels (label) VALUES (?)", [(l,) for l in {l for _, l in per_label}])
+    conn.executemany("""
+        INSERT INTO test_labels (test_ref, label_id, samples)
+        SELECT t.id, l.id, ? FROM tests t, labels l WHERE t.test_id = ? AND l.label = ?
+        ON CONFLICT(test_ref, label_id) DO UPDATE SET samples = samples + excluded.samples
+    """, [(n, test_id, label) for (test_id, label), n in per_label.items()])
+
+def rebuild_catalog(conn):
+    # tests and labels rows are dictionary codes referenced by sample_data, so
+    # they are updated in place rather than recreated. Compacted tests (raw_before
+    # set) no longer have every sample and keep the counts taken at ingest.
+    compacted = "SELECT id FROM tests WHERE raw_before IS NOT NULL"
+    with conn:
+        conn.execute("UPDATE tests SET first_ts = NULL, last_ts = NULL, samples = 0, errors = 0 "
+                     "WHERE raw_before IS NULL")
+        tables = sample_tables(conn)
+        for table in tables:
+            conn.execute(f"""
+                UPDATE tests SET first_ts = s.lo, last_ts = s.hi, samples = s.n, errors = s.errs
+                FROM (SELECT test_ref, MIN(timestamp) AS lo, MAX(timestamp) AS hi, COUNT(*) AS n,
+                             SUM(CASE WHEN success = 0 THEN 1 ELSE 0 END) AS errs
+                      FROM {table} WHERE test_ref > 0 GROUP BY test_ref) s
+                WHERE tests.id = s.test_ref AND tests.raw_before IS NULL
+            """)
+        conn.execute("DELETE FROM tests WHERE samples = 0 AND raw_before IS NULL")
+        conn.execute(f"DELETE FROM test_labels WHERE test_ref NOT IN ({compacted})")
+        for table in tables:
+            conn.execute(f"""
+                INSERT INTO test_labels (test_ref, label_id, samples)
+                SELECT test_ref, label_id, COUNT(*) FROM {table}
+                WHERE test_ref > 0 AND label_id > 0 AND test_ref NOT IN ({compacted})
+                GROUP BY test_ref, label_id
+            """)
+    TESTS.clear()   # codes of tests dropped above must not be reused
+
+def refresh_test_catalog(conn, test_id):
+    # recompute one test's catalog rows from its samples, inside the caller's transaction;
+    # used once everything older than those samples is gone, so no retention horizon remains
+    source = sample_source(test_id, conn)
+    conn.execute(f"""
+        UPDATE tests SET first_ts = s.lo, last_ts = s.hi, samples = s.n, errors = s.errs, raw_before = NULL
+        FROM (SELECT MIN(timestamp) AS lo, MAX(timestamp) AS hi, COUNT(*) AS n,
+                     COALESCE(SUM(CASE WHEN success = 0 THEN 1 ELSE 0 END), 0) AS errs
+              FROM {source} WHERE test_id = ?) s
+        WHERE tests.test_id = ?
+    """, (test_id, test_id))
+    conn.execute("DELETE FROM test_labels WHERE test_ref IN (SELECT id FROM tests WHERE test_id = ?)",
+                 (test_id,))
+    conn.execute(f"""
+        INSERT INTO test_labels (test_ref, label_id, samples)
+        SELECT t.id, l.id, COUNT(*) FROM {source} j
+        JOIN labels l ON l.label = j.label JOIN tests t ON t.test_id = j.test_id
+        WHERE j.test_id = ? GROUP BY t.id, l.id
+    """, (test_id,))
+
+def catalog_labels(test_id=None):
+    if test_id:
+        rows = run_query("""
+            SELECT l.label FROM test_labels tl
+            JOIN tests t ON t.id = tl.test_ref JOIN labels l ON l.id = tl.label_id
+            WHERE t.test_id = ? ORDER BY l.label
+        """, (test_id,))
+    else:
+        rows = run_query("SELECT label FROM labels WHERE id IN (SELECT label_id FROM test_labels) "
+                         "ORDER BY label")
+    return [r[0] for r in rows]
+
+@app.route("/api/tests", methods=["GET"])
+def api_tests():
+    rows = run_query(f"""
+        SELECT test_id, first_ts, last_ts, samples, errors FROM tests
+        WHERE {NOT_DELETING} ORDER BY test_id
+    """)
+    return jsonify([{"test_id": r[0], "first_ts": r[1], "last_ts": r[2], "samples": r[3], "errors": r[4]}
+                    for r in rows])
+
+@app.route("/api/labels", methods=["GET"])
+def api_labels():
+    return jsonify(catalog_labels(request.args.get("test_id")))
+
+@app.route("/api/rebuild_catalog", methods=["POST"])
+def api_rebuild_catalog():
+    INGEST.flush(timeout=10)
+    with db_pool().writer() as conn:
+        rebuild_catalog(conn)
+    rows = run_query("SELECT COUNT(*), COALESCE(SUM(samples), 0) FROM tests")
+    return jsonify({"message": "Catalog rebuilt.", "tests": rows[0][0], "samples": rows[0][1]})
 
 # --------- Download CSV endpoints ----------
 def generate_csv(rows, headers):
@@ -491,34 +2956,18 @@ def download_errors_csv():
 
 #     return jsonify({"timestamps": timestamps, "error_pct": error_pct})
 @app.route("/api/errorpct", methods=["GET"])
+@conditional_get(moving=True)
 def api_errorpct():
-    window = request.args.get("window", default=60, type=int)
-    end = request.args.get("end", type=int) or int(time.time())
-    start = end - window + 1
+    start, end, res, first = series_window()
     test_id = request.args.get("test_id")
-
-    if test_id:
-        rows = run_query(
-            "SELECT timestamp, SUM(CASE WHEN success=0 THEN 1 ELSE 0 END)*100.0/COUNT(*) "
-            "FROM jmeter_samples "
-            "WHERE timestamp BETWEEN ? AND ? AND test_id=? "
-            "GROUP BY timestamp ORDER BY timestamp ASC",
-            (start, end, test_id)
-        )
-    else:
-        rows = run_query(
-            "SELECT timestamp, SUM(CASE WHEN success=0 THEN 1 ELSE 0 END)*100.0/COUNT(*) "
-            "FROM jmeter_samples "
-            "WHERE timestamp BETWEEN ? AND ? "
-            "GROUP BY timestamp ORDER BY timestamp ASC",
-            (start, end)
-        )
+    rows = query_rollup("SUM(errors) * 100.0 / SUM(count)", first, end, test_id, res=res)
 
     ts_map = {r[0]: round(r[1], 2) for r in rows}
-    timestamps = [sec for sec in range(start, end + 1)]
+    timestamps = list(bucket_range(first, end, res))
     values = [ts_map.get(sec, 0.0) for sec in timestamps]
 
-    return jsonify({"timestamps": timestamps, "error_pct": values})
+    return jsonify({"timestamps": timestamps, "error_pct": values, "resolution": res,
+                    "cursor": series_cursor(end, res)})
 
 
 @app.route("/download/success.csv")
@@ -567,8 +3016,7 @@ def download_snapshot():
 @app.route("/dashboard")
 def dashboard():
     # Build list of distinct labels for filter dropdown
-    rows = run_query("SELECT DISTINCT label FROM jmeter_samples")
-    labels = sorted([r[0] for r in rows])
+    labels = catalog_labels()
     # serve a single big html template (kept inline for single-file simplicity)
     html = render_template_string("""
 <!doctype html>
@@ -1045,20 +3493,45 @@ let totalTpsChart = new Chart(document.getElementById('totalTpsChart'), {
   
 // ...existing code...
 // ...existing code...
-async function loadTotalTPS() {
+// ---------- Dashboard state (one request per refresh) ----------
+function seriesWindow() {
     const { start, end, duration, mode } = getRangeParams();
-    let window = 60;
-    if (mode === 'duration') {
-        window = duration;
-    } else if (mode === 'range') {
-        window = Math.max(60, end - start + 1);
+    if (mode === 'duration') return duration;
+    if (mode === 'range') return Math.max(60, end - start + 1);
+    return 60;
+}
+
+// fetch JSON, revalidating with the ETag of the last response for the same URL;
+// a 304 reuses that body without the server recomputing anything
+const etagCache = new Map();
+async function fetchJSON(url) {
+    const cached = etagCache.get(url);
+    const resp = await fetch(url, cached ? { headers: { 'If-None-Match': cached.etag } } : {});
+    if (resp.status === 304 && cached) return cached.body;
+    const body = await resp.json();
+    const etag = resp.headers.get('ETag');
+    if (etag) {
+        etagCache.delete(url);
+        etagCache.set(url, { etag, body });
+        if (etagCache.size > 50) etagCache.delete(etagCache.keys().next().value);
     }
+    return body;
+}
+
+async function loadDashboardState(withSeries = true, since = null) {
+    const { start, end } = getRangeParams();
     const testId = $('#testIdSelect').val();
-    let url = '/api/label_tps?window=' + window + (end ? ('&end=' + end) : '');
-    if (testId) url += '&test_id=' + encodeURIComponent(testId);
+    const params = new URLSearchParams();
+    if (testId) params.append('test_id', testId);
+    if (start) params.append('start', start);
+    if (end) params.append('end', end);
+    params.append('window', seriesWindow());
+    if (!withSeries) params.append('series', '0');
+    if (since !== null) params.append('since', since);
+    return await fetchJSON('/api/dashboard_state?' + params.toString());
+}
 
-    const resp = await fetch(url);
-    const data = await resp.json();
+function renderTotalTPS(data) {
     const tz = $('#tzSelect').val();
     const labels = data.timestamps.map(s => moment.unix(s).tz(tz).format('HH:mm:ss A'));
 
@@ -1086,20 +3559,7 @@ async function loadTotalTPS() {
     totalTpsChart.update();
 }
 // ...existing code... 
-async function loadTPS() {
-  const { start, end, duration, mode } = getRangeParams();
-  const testId = $('#testIdSelect').val();
-  let url = '/api/total_tps?';
-  if (mode === 'duration') {
-    url += 'window=' + duration + '&end=' + end;
-  } else if (mode === 'range') {
-    url += 'window=' + Math.max(60, end - start + 1) + '&end=' + end;
-  } else {
-    url += 'window=60';
-  }
-  if (testId) url += '&test_id=' + encodeURIComponent(testId);
-  const resp = await fetch(url);
-  const data = await resp.json();
+function renderTPS(data) {
   const tz = $('#tzSelect').val();
   tpsChart.data.labels = data.timestamps.map(s => moment.unix(s).tz(tz).format('HH:mm:ss A'));
   // Always fill missing values with 0
@@ -1119,16 +3579,8 @@ async function loadTPS() {
   tpsChart.update();
 }
 // ...existing code...
-async function loadThreads() {
-  const { start, end } = getRangeParams();
+function renderThreads(data) {
   const testId = $('#testIdSelect').val();
-
-  let window = (start && end) ? Math.max(60, end - start + 1) : 60;
-  let url = '/api/threads?window=' + window + (end ? ('&end=' + end) : '');
-  if (testId) url += '&test_id=' + encodeURIComponent(testId);
-
-  const resp = await fetch(url);
-  const data = await resp.json();
   const tz = $('#tzSelect').val();
 
   // Labels: match timestamps from backend
@@ -1160,18 +3612,7 @@ async function loadThreads() {
 }
 
 
-async function loadErrorPct() {
-  const { start, end } = getRangeParams();
-  const testId = $('#testIdSelect').val();
-  let window = 60;
-  if (start && end) {
-    window = Math.max(60, end - start + 1);
-  }
-  let url = '/api/errorpct?window=' + window + (end ? ('&end=' + end) : '');
-  if (testId) url += '&test_id=' + encodeURIComponent(testId);
-
-  const resp = await fetch(url);
-  const data = await resp.json();
+function renderErrorPct(data) {
   const tz = $('#tzSelect').val();
   errorPctChart.data.labels = data.timestamps.map(s =>
     moment.unix(s).tz(tz).format('HH:mm:ss A')
@@ -1190,43 +3631,17 @@ async function loadErrorPct() {
 }
 
 
-async function loadRespTime() {
-  const { start, end, tz } = getRangeParams();
-  const testId = $('#testIdSelect').val();
-  const params = new URLSearchParams();
-  if (testId) params.append('test_id', testId);
-  if (start) params.append('start', start);
-  if (end) params.append('end', end);
-
-  const resp = await fetch('/api/response_times?' + params.toString());
-  const data = await resp.json();
-
-  // Find the union of all timestamps
-  let allTimestamps = [];
-  for (const labelData of Object.values(data)) {
-    if (labelData.timestamps) {
-      allTimestamps = allTimestamps.concat(labelData.timestamps);
-    }
-  }
-  allTimestamps = Array.from(new Set(allTimestamps)).sort((a, b) => a - b);
-
-  const labels = allTimestamps.map(s => moment.unix(s).tz(tz).format('HH:mm:ss A'));
-  respTimeChart.data.labels = labels;
+function renderRespTime(data) {
+  // data.response_times holds one avg per label per bucket, aligned to data.timestamps
+  const tz = $('#tzSelect').val();
+  respTimeChart.data.labels = data.timestamps.map(s => moment.unix(s).tz(tz).format('HH:mm:ss A'));
   respTimeChart.data.datasets = [];
 
   const colors = ['#e74c3c','#3498db','#2ecc71','#f39c12','#9b59b6','#1abc9c','#34495e','#95a5a6'];
   let colorIdx = 0;
 
-  for (const [label, values] of Object.entries(data)) {
-    const timeMap = {};
-    if (values.timestamps && values.response_times) {
-      values.timestamps.forEach((t, i) => { timeMap[t] = values.response_times[i]; });
-    }
-
-    // Align to union of timestamps
-    let alignedRespTimes = allTimestamps.map(t =>
-      (timeMap[t] !== undefined && timeMap[t] !== 0) ? timeMap[t] : null
-    );
+  for (const [label, values] of Object.entries(data.response_times)) {
+    let alignedRespTimes = values.map(v => (v !== null && v !== 0) ? v : null);
 
     // Force start and end to 0
     if (alignedRespTimes.length > 0) {
@@ -1266,9 +3681,10 @@ async function loadRespTime() {
     if (start) params.append('start', start);
     if (end) params.append('end', end);
 
-    const resp = await fetch('/api/aggregate?' + params.toString());
-    const data = await resp.json();
+    renderAggregate(await fetchJSON('/api/aggregate?' + params.toString()));
+    }
 
+    function renderAggregate(data) {
     // Initialize DataTable only once
     let table;
     if (!$.fn.dataTable.isDataTable('#aggTable')) {
@@ -1301,14 +3717,7 @@ async function loadRespTime() {
 }
                                 
 
-  async function loadErrors() {
-  const {start,end} = getRangeParams();
-  const testId = getTestId();
-  let url = '/api/errors?test_id=' + encodeURIComponent(testId) + '&';
-  if(start) url += 'start=' + start + '&';
-  if(end) url += 'end=' + end + '&';
-  const data = await (await fetch(url)).json();
-
+  function renderErrors(data) {
   // Initialize DataTable only once
   let table;
   if (!$.fn.dataTable.isDataTable('#errTable')) {
@@ -1323,14 +3732,7 @@ async function loadRespTime() {
   table.draw();
 }
 
-async function loadSuccess() {
-  const {start,end} = getRangeParams();
-  const testId = getTestId();
-  let url = '/api/success?test_id=' + encodeURIComponent(testId) + '&';
-  if(start) url += 'start=' + start + '&';
-  if(end) url += 'end=' + end + '&';
-  const data = await (await fetch(url)).json();
-
+function renderSuccess(data) {
   // Initialize DataTable only once
   let table;
   if (!$.fn.dataTable.isDataTable('#succTable')) {
@@ -1348,23 +3750,138 @@ async function loadSuccess() {
   async function refreshAll() {
     $('#loadingStatus span').hide();
     updateRangeDisplays();                                
-    await Promise.all([
-  loadTPS(), loadThreads(), loadErrorPct(), loadAggregate(),
-  loadErrors(), loadSuccess(), loadRespTime(), loadTotalTPS(),loadTPS()
-  ]);
+    const state = await loadDashboardState();
+    renderSeries(state.series);
+    renderAggregate(state.aggregate); renderErrors(state.errors); renderSuccess(state.success);
+    liveSeries = state.series;
+    liveSeries.size = liveSeries.timestamps.length;
     setAutoRefresh(parseInt($('#refreshSelect').val()));
     $('#loadingStatus span').show();
     setTimeout(() => { $('#loadingStatus span').fadeOut(); }, 2000); // Hide after 2 seconds
   }
 
+  function renderSeries(series) {
+    renderTPS(series); renderThreads(series); renderErrorPct(series);
+    renderRespTime(series); renderTotalTPS(series);
+  }
+
+  // charts are already fed by the stream, so ticks only refresh the tables
+  async function refreshTables() {
+    const state = await loadDashboardState(false);
+    renderAggregate(state.aggregate); renderErrors(state.errors); renderSuccess(state.success);
+  }
+
+  // polling without a stream: fetch only the buckets from the last cursor on and
+  // merge them into the series the charts already hold
+  async function refreshSince() {
+    const state = await loadDashboardState(true, liveSeries.cursor);
+    if (state.series.resolution !== liveSeries.resolution) return refreshAll();
+    mergeSeries(liveSeries, state.series);
+    renderAggregate(state.aggregate); renderErrors(state.errors); renderSuccess(state.success);
+  }
+
+  // index of bucket ts in s, growing every array with empty buckets up to it
+  function seriesIndex(s, ts) {
+    const idx = (ts - s.timestamps[0]) / s.resolution;
+    if (idx < 0 || !Number.isInteger(idx)) return -1;
+    while (s.timestamps.length <= idx) {
+      s.timestamps.push(s.timestamps[0] + s.timestamps.length * s.resolution);
+      s.tps.push(0); s.threads.push(0); s.error_pct.push(0);
+      for (const label in s.label_tps) { s.label_tps[label].push(0); s.response_times[label].push(null); }
+    }
+    return idx;
+  }
+
+  function setLabelPoint(s, label, idx, tps, rt) {
+    if (!(label in s.label_tps)) {
+      s.label_tps[label] = s.timestamps.map(() => 0);
+      s.response_times[label] = s.timestamps.map(() => null);
+    }
+    s.label_tps[label][idx] = tps;
+    s.response_times[label][idx] = rt;
+  }
+
+  // slide the window forward, keeping the bucket count of the full load
+  function trimSeries(s) {
+    const drop = s.timestamps.length - s.size;
+    if (drop > 0) {
+      s.timestamps.splice(0, drop); s.tps.splice(0, drop); s.threads.splice(0, drop); s.error_pct.splice(0, drop);
+      for (const label in s.label_tps) { s.label_tps[label].splice(0, drop); s.response_times[label].splice(0, drop); }
+    }
+  }
+
+  function scheduleRender() {
+    // a reconnect replays a burst of frames, draw once per animation frame
+    if (!renderPending) {
+      renderPending = true;
+      requestAnimationFrame(() => { renderPending = false; renderSeries(liveSeries); });
+    }
+  }
+
+  function mergeSeries(s, d) {
+    d.timestamps.forEach((ts, j) => {
+      const idx = seriesIndex(s, ts);
+      if (idx < 0) return;
+      s.tps[idx] = d.tps[j]; s.threads[idx] = d.threads[j]; s.error_pct[idx] = d.error_pct[j];
+      for (const label in s.label_tps) setLabelPoint(s, label, idx, 0, null);
+      for (const label in d.label_tps) setLabelPoint(s, label, idx, d.label_tps[label][j], d.response_times[label][j]);
+    });
+    s.cursor = d.cursor;
+    trimSeries(s);
+    scheduleRender();
+  }
+
+  // ---------- Live stream ----------
+  // While auto-refresh is on, /api/stream pushes one frame per closed second and
+  // the charts are extended in place instead of re-fetching the whole window.
+  let liveStream = null;
+  let liveSeries = null;
+  let renderPending = false;
+
+  function stopLiveStream() {
+    if (liveStream) { liveStream.close(); liveStream = null; }
+  }
+
+  function startLiveStream() {
+    stopLiveStream();
+    const s = liveSeries;
+    // frames are per second, so only a live window on the 1s tier can be extended
+    if (!s || s.resolution !== 1 || !s.timestamps.length || getRangeParams().mode === 'range') return;
+    const params = new URLSearchParams();
+    const testId = $('#testIdSelect').val();
+    if (testId) params.append('test_id', testId);
+    // replay from the cursor, later seconds were still filling when the series was read
+    params.append('since', s.cursor - 1);
+    liveStream = new EventSource('/api/stream?' + params.toString());
+    liveStream.onmessage = e => appendFrame(JSON.parse(e.data));
+  }
+
+  function appendFrame(f) {
+    const s = liveSeries;
+    const idx = seriesIndex(s, f.ts);
+    if (idx < 0) return;
+    s.tps[idx] = f.tps; s.threads[idx] = f.threads; s.error_pct[idx] = f.error_pct;
+    for (const label in s.label_tps) setLabelPoint(s, label, idx, 0, null);
+    for (const label in f.labels) setLabelPoint(s, label, idx, f.labels[label].count, f.labels[label].avg_rt);
+    s.cursor = f.ts + 1;
+    trimSeries(s);
+    scheduleRender();
+  }
+
   // ---------- Auto-refresh ----------
   let autoHandle = null;
   function setAutoRefresh(seconds) {
   if(autoHandle) { clearInterval(autoHandle); autoHandle = null; }
   if(seconds > 0) {
     $('#autoStatus').show();
-    autoHandle = setInterval(refreshAll, seconds * 1000);
+    startLiveStream();
+    autoHandle = setInterval(() => {
+      if (liveStream) refreshTables();
+      else if (liveSeries && getRangeParams().mode !== 'range') refreshSince();
+      else refreshAll();
+    }, seconds * 1000);
   } else {
+    stopLiveStream();
     $('#autoStatus').hide();
   }
   }
@@ -1481,71 +3998,387 @@ for (const [label, tpsArr] of Object.entries(data.label_tps)) {
     return html
 
 @app.route("/api/label_tps", methods=["GET"])
+@conditional_get(moving=True)
 def api_label_tps():
-    window = request.args.get("window", default=60, type=int)
-    end = request.args.get("end", type=int) or int(time.time())
-    start = end - window + 1
+    start, end, res, first = series_window()
     test_id = request.args.get("test_id")
 
-    if test_id:
-        label_rows = run_query(
-            "SELECT DISTINCT label FROM jmeter_samples WHERE timestamp BETWEEN ? AND ? AND test_id=?",
-            (start, end, test_id)
-        )
-    else:
-        label_rows = run_query(
-            "SELECT DISTINCT label FROM jmeter_samples WHERE timestamp BETWEEN ? AND ?",
-            (start, end)
-        )
-
-    labels = [r[0] for r in label_rows]
+    rows = query_rollup("SUM(count), MAX(last_sec)", first, end, test_id, by_label=True, res=res)
+    last = {}
+    for _label, sec, _cnt, last_sec in rows:
+        last[sec] = max(last.get(sec, last_sec), last_sec)
+    per_label = {}
+    for label, sec, cnt, _last_sec in rows:
+        per_label.setdefault(label, {})[sec] = float(cnt) / bucket_seconds(sec, last[sec], res)
+    timestamps = list(bucket_range(first, end, res))
     label_tps = {}
-    for label in labels:
-        if test_id:
-            rows = run_query(
-                "SELECT timestamp, COUNT(*) FROM jmeter_samples "
-                "WHERE timestamp BETWEEN ? AND ? AND label=? AND test_id=? "
-                "GROUP BY timestamp ORDER BY timestamp ASC",
-                (start, end, label, test_id)
-            )
-        else:
-            rows = run_query(
-                "SELECT timestamp, COUNT(*) FROM jmeter_samples "
-                "WHERE timestamp BETWEEN ? AND ? AND label=? "
-                "GROUP BY timestamp ORDER BY timestamp ASC",
-                (start, end, label)
-            )
-        ts_map = {r[0]: float(r[1]) for r in rows}
-        label_tps[label] = [round(ts_map.get(sec, 0.0), 2) for sec in range(start, end + 1)]
+    for label, ts_map in per_label.items():
+        label_tps[label] = [round(ts_map.get(sec, 0.0), 2) for sec in timestamps]
 
-    timestamps = [sec for sec in range(start, end + 1)]
-    return jsonify({"timestamps": timestamps, "label_tps": label_tps})
+    return jsonify({"timestamps": timestamps, "label_tps": label_tps, "resolution": res,
+                    "cursor": series_cursor(end, res)})
 
 @app.route("/api/testids", methods=["GET"])
 def api_testids():
-    rows = run_query("SELECT DISTINCT test_id FROM jmeter_samples")
+    rows = run_query(f"SELECT test_id FROM tests WHERE {NOT_DELETING} ORDER BY test_id")
     return jsonify([r[0] for r in rows])
 
+# --------- Background deletion jobs ----------
+# /api/delete_testid only records a job and hides the test (test_state 'deleting').
+# One worker thread then deletes the test's samples and rollup rows in batches of
+# DELETE_BATCH_ROWS, each its own short writer transaction, pausing in between so
+# the ingest writer gets the lock, and finally returns the freed pages to the OS
+# with PRAGMA incremental_vacuum. Jobs live in delete_jobs and resume after a
+# restart. The job's watermark is the last id the ingest writer had committed when
+# it was submitted, so the request never waits on the ingest queue. Samples still
+# queued then, or arriving later, are kept and the test reappears, with its rollup
+# tiers rebuilt from them (buckets they share with the deleted data were deleted too).
+DELETE_BATCH_ROWS = 20000
+DELETE_BATCH_PAUSE = 0.05      # seconds between batches
+VACUUM_STEP_PAGES = 2000       # pages freed per incremental_vacuum transaction
+DELETE_JOB_COLUMNS = "id, test_id, status, total, deleted, created, finished, error"
+
+_delete_wakeup = threading.Event()
+_delete_worker = None
+
+def submit_delete_job(test_id):
+    # returns the job id; a test already being deleted keeps its pending job
+    with db_pool().writer() as conn:
+        with conn:
+            pending = conn.execute("SELECT id FROM delete_jobs WHERE test_id = ? AND status IN "
+                                   "('queued', 'running')", (test_id,)).fetchone()
+            if pending:
+                return pending[0]
+            test = conn.execute("SELECT id, samples FROM tests WHERE test_id = ?", (test_id,)).fetchone()
+            max_bucket = conn.execute(f"SELECT MAX(bucket) FROM {rollup_table(1)} WHERE test_id = ?",
+                                      (test_id,)).fetchone()[0]
+            job_id = conn.execute("""
+                INSERT INTO delete_jobs (test_id, test_ref, watermark, max_bucket, status, total, created)
+                VALUES (?, ?, ?, ?, 'queued', ?, ?)
+            """, (test_id, test[0] if test else None, last_sample_id(conn), max_bucket,
+                  test[1] if test else 0, time.time())).lastrowid
+            conn.execute("""
+                INSERT INTO test_state (test_id, status) VALUES (?, 'deleting')
+                ON CONFLICT(test_id) DO UPDATE SET status = 'deleting', finalized_at = NULL
+            """, (test_id,))
+            conn.execute("DELETE FROM test_summaries WHERE test_id = ?", (test_id,))
+    forget_test_results(test_id)
+    _delete_wakeup.set()
+    return job_id
+
+def forget_test_results(test_id):
+    invalidate_aggregate_cache(test_id)
+    with db_pool().writer() as conn:
+        with conn:
+            bump_data_version(conn, [test_id])
+    RESULT_CACHE.invalidate({test_id: float("-inf")})
+
+def delete_job(job_id):
+    rows = run_query(f"SELECT {DELETE_JOB_COLUMNS} FROM delete_jobs WHERE id = ?", (job_id,))
+    return dict(zip(DELETE_JOB_COLUMNS.split(", "), rows[0])) if rows else None
+
+def run_delete_batches(delete_batch, job_id=None):
+    # repeats delete_batch(conn) in its own transaction until it deletes nothing and
+    # returns the total; with a job_id the rows add to that job's progress
+    total = 0
+    while True:
+        with db_pool().writer() as conn:
+            with conn:
+                n = delete_batch(conn)
+                if job_id is not None:
+                    conn.execute("UPDATE delete_jobs SET deleted = deleted + ? WHERE id = ?", (n, job_id))
+        if not n:
+            return total
+        total += n
+        time.sleep(DELETE_BATCH_PAUSE)
+
+def run_delete_job(job_id):
+    _, test_id, test_ref, watermark, max_bucket, status = run_query(
+        "SELECT id, test_id, test_ref, watermark, max_bucket, status FROM delete_jobs WHERE id = ?",
+        (job_id,))[0]
+    if status in ("queued", "running"):
+        with db_pool().writer() as conn:
+            with conn:
+                conn.execute("UPDATE delete_jobs SET status = 'running' WHERE id = ?", (job_id,))
+        if test_ref is not None:
+            run_delete_batches(lambda conn: delete_sample_batch(conn, test_ref, watermark, DELETE_BATCH_ROWS),
+                               job_id)
+            forget_test_results(test_id)
+        for res in ROLLUP_TIERS:
+            if max_bucket is None:
+                break
+            table = rollup_table(res)
+            run_delete_batches(lambda conn: conn.execute(f"""
+                DELETE FROM {table} WHERE test_id = ? AND (bucket, label) IN (
+                    SELECT bucket, label FROM {table} WHERE test_id = ? AND bucket <= ? LIMIT ?)
+            """, (test_id, test_id, max_bucket, DELETE_BATCH_ROWS)).rowcount)
+        with db_pool().writer() as conn:
+            with conn:
+                state = conn.execute("SELECT status FROM test_state WHERE test_id = ?", (test_id,)).fetchone()
+                if state is None or state[0] == "deleting":
+                    conn.execute("DELETE FROM test_state WHERE test_id = ?", (test_id,))
+                    conn.execute("DELETE FROM test_labels WHERE test_ref = ?", (test_ref,))
+                    conn.execute("DELETE FROM tests WHERE id = ?", (test_ref,))
+                    conn.execute("DELETE FROM retention_policy WHERE test_id = ?", (test_id,))
+                else:   # samples arrived after the request, the test stays with those
+                    refresh_test_catalog(conn, test_id)
+                    rebuild_test_rollups(conn, test_id)
+                conn.execute("UPDATE delete_jobs SET status = 'vacuuming' WHERE id = ?", (job_id,))
+            TESTS.forget(test_id)
+        forget_test_results(test_id)
+    incremental_vacuum()
+    with db_pool().writer() as conn:
+        with conn:
+            conn.execute("UPDATE delete_jobs SET status = 'done', finished = ? WHERE id = ?",
+                         (time.time(), job_id))
+
+def incremental_vacuum():
+    # hand free pages back in VACUUM_STEP_PAGES steps; a no-op unless the file has
+    # auto_vacuum=INCREMENTAL (new files do, see ConnectionPool._connect)
+    while True:
+        with db_pool().writer() as conn:
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                return
+            if not conn.execute("PRAGMA freelist_count").fetchone()[0]:
+                return
+            conn.executescript(f"PRAGMA incremental_vacuum({VACUUM_STEP_PAGES})")
+        time.sleep(DELETE_BATCH_PAUSE)
+
+def run_delete_worker():
+    while True:
+        _delete_wakeup.wait()
+        _delete_wakeup.clear()
+        while True:
+            pending = run_query("SELECT id FROM delete_jobs WHERE status IN ('queued', 'running', 'vacuuming') "
+                                "ORDER BY id LIMIT 1")
+            if not pending:
+                break
+            job_id = pending[0][0]
+            try:
+                run_delete_job(job_id)
+            except Exception as e:
+                app.logger.exception("delete job %s failed", job_id)
+                with db_pool().writer() as conn:
+                    with conn:
+                        conn.execute("UPDATE delete_jobs SET status = 'failed', finished = ?, error = ? "
+                                     "WHERE id = ?", (time.time(), str(e), job_id))
+
+def start_delete_worker():
+    # also picks up jobs a previous run left unfinished
+    global _delete_worker
+    if _delete_worker is None or not _delete_worker.is_alive():
+        _delete_worker = threading.Thread(target=run_delete_worker, name="delete-jobs", daemon=True)
+        _delete_worker.start()
+    _delete_wakeup.set()
+
 @app.route("/api/delete_testid", methods=["POST"])
 def delete_testid():
     data = request.get_json()
     test_id = data.get("test_id")
     if not test_id:
         return jsonify({"message": "No test_id provided"}), 400
-
-    run_query("DELETE FROM jmeter_samples WHERE test_id = ?", (test_id,))
-    return jsonify({"message": f"All rows with test_id '{test_id}' deleted."})
+    job_id = submit_delete_job(test_id)
+    start_delete_worker()
+    return jsonify({"message": f"Deleting all rows with test_id '{test_id}' in the background.",
+                    "job_id": job_id, "status_url": f"/api/jobs/{job_id}"}), 202
+
+@app.route("/api/jobs", methods=["GET"])
+def api_jobs():
+    rows = run_query(f"SELECT {DELETE_JOB_COLUMNS} FROM delete_jobs ORDER BY id DESC LIMIT 50")
+    return jsonify([dict(zip(DELETE_JOB_COLUMNS.split(", "), r)) for r in rows])
+
+@app.route("/api/jobs/<int:job_id>", methods=["GET"])
+def api_job(job_id):
+    job = delete_job(job_id)
+    if job is None:
+        return jsonify({"message": f"Unknown job {job_id}"}), 404
+    return jsonify(job)
+
+# --------- Raw sample retention ----------
+# Successful samples older than a test's retention are deleted by a background
+# thread every RETENTION_CHECK_INTERVAL, in the same short writer batches as
+# delete jobs. The retention is the test's retention_policy row, else the '*' row,
+# else RAW_RETENTION_DAYS. The rollup tiers keep those seconds, and tests.raw_before
+# records the horizon: raw-percentile aggregates, the success table and raw
+# response times fall back to the rollups for windows that start before it.
+# Failed samples are kept, so the errors table stays exact. Frozen summaries were
+# computed from every sample and are left as they are.
+RAW_RETENTION_DAYS = 0            # default without a '*' policy; 0 keeps raw samples forever
+RETENTION_CHECK_INTERVAL = 3600   # seconds between retention passes
+
+_retention_wakeup = threading.Event()
+_retention_worker = None
+
+def raw_horizon(test_id):
+    rows = run_query("SELECT raw_before FROM tests WHERE test_id = ?", (test_id,))
+    return rows[0][0] if rows else None
+
+def raw_compacted(test_id, start):
+    # True when a window starting at `start` reaches back past the horizon
+    horizon = raw_horizon(test_id)
+    return horizon is not None and (not start or start < horizon)
+
+def retention_policies():
+    # (default days, {test_id: days})
+    policies = dict(run_query("SELECT test_id, raw_days FROM retention_policy"))
+    return policies.pop("*", RAW_RETENTION_DAYS), policies
+
+def apply_retention(now=None):
+    # one retention pass; returns {test_id: successful samples deleted}
+    now = time.time() if now is None else now
+    default, policies = retention_policies()
+    compacted = {}
+    for ref, test_id, first_ts, raw_before in run_query(
+            f"SELECT id, test_id, first_ts, raw_before FROM tests WHERE {NOT_DELETING}"):
+        days = policies.get(test_id, default)
+        if not days:
+            continue
+        cutoff = int(now - days * 86400)
+        if first_ts is None or cutoff <= max(first_ts, raw_before or 0):
+            continue   # nothing past the cutoff that is not compacted already
+        # the horizon moves first, so reads switch to the rollups before rows go
+        with db_pool().writer() as conn:
+            with conn:
+                conn.execute("UPDATE tests SET raw_before = ? WHERE id = ?", (cutoff, ref))
+        forget_test_results(test_id)
+        compacted[test_id] = run_delete_batches(
+            lambda conn: delete_expired_sample_batch(conn, ref, cutoff, DELETE_BATCH_ROWS))
+    if any(compacted.values()):
+        incremental_vacuum()
+    return compacted
+
+def run_retention():
+    while True:
+        _retention_wakeup.wait(RETENTION_CHECK_INTERVAL)
+        _retention_wakeup.clear()
+        try:
+            compacted = apply_retention()
+            if compacted:
+                app.logger.info("retention compacted %s", compacted)
+        except Exception:
+            app.logger.exception("retention pass failed")
+
+def start_retention():
+    global _retention_worker
+    if _retention_worker is None or not _retention_worker.is_alive():
+        _retention_worker = threading.Thread(target=run_retention, name="raw-retention", daemon=True)
+        _retention_worker.start()
+
+@app.route("/api/retention", methods=["GET"])
+def api_retention():
+    default, policies = retention_policies()
+    horizons = run_query("SELECT test_id, raw_before FROM tests WHERE raw_before IS NOT NULL ORDER BY test_id")
+    return jsonify({"default_days": default, "tests": policies, "raw_before": dict(horizons),
+                    "check_interval": RETENTION_CHECK_INTERVAL})
+
+@app.route("/api/retention", methods=["POST"])
+def set_retention():
+    # {"raw_days": N} sets the global default, {"test_id": ..., "raw_days": N} one
+    # test's; "raw_days": null drops the setting. A pass runs right after.
+    data = request.get_json() or {}
+    test_id = data.get("test_id") or "*"
+    days = data.get("raw_days")
+    if days is not None and (isinstance(days, bool) or not isinstance(days, (int, float)) or days < 0):
+        return jsonify({"message": "raw_days must be a number of days >= 0 (0 keeps raw samples forever)"}), 400
+    with db_pool().writer() as conn:
+        with conn:
+            if days is None:
+                conn.execute("DELETE FROM retention_policy WHERE test_id = ?", (test_id,))
+            else:
+                conn.execute("INSERT OR REPLACE INTO retention_policy (test_id, raw_days) VALUES (?, ?)",
+                             (test_id, days))
+    start_retention()
+    _retention_wakeup.set()
+    scope = "all tests" if test_id == "*" else f"test_id '{test_id}'"
+    setting = "reset to the default" if days is None else f"set to {days} days"
+    return jsonify({"message": f"Raw sample retention for {scope} {setting}.",
+                    "test_id": test_id, "raw_days": days})
+
+RESPONSE_TIME_MAX_POINTS = 10000   # buckets per label a ?bucket=N request may ask for
+
+def response_time_buckets(test_id, start, end, width):
+    # per-label count/avg/min/max/p90 on one grid of `width`-second buckets shared
+    # by every label, read from the coarsest rollup tier that divides the width.
+    # Only samples inside [start, end] count, whatever the width: tier buckets that
+    # stick out of the window are read from the per-second tier instead.
+    tier = max(r for r in ROLLUP_TIERS if width % r == 0)
+    first = start - start % width
+    lo = start + (-start) % tier          # whole tier buckets cover [lo, hi)
+    hi = end + 1 - (end + 1) % tier
+    if lo > hi:
+        lo = hi = end + 1
+    rows = run_query(f"""
+        SELECT label, bucket - bucket % ? AS b, SUM(count), SUM(sum_rt), MIN(min_rt), MAX(max_rt),
+               counts_merge_agg(hist)
+        FROM (SELECT label, bucket, count, sum_rt, min_rt, max_rt, hist FROM {rollup_table(tier)}
+              WHERE test_id = ? AND bucket BETWEEN ? AND ?
+              UNION ALL
+              SELECT label, bucket, count, sum_rt, min_rt, max_rt, hist FROM {rollup_table(1)}
+              WHERE test_id = ? AND (bucket BETWEEN ? AND ? OR bucket BETWEEN ? AND ?))
+        GROUP BY label, b
+    """, (width, test_id, lo, hi - 1, test_id, start, lo - 1, hi, end))
+    timestamps = list(bucket_range(start, end, width))
+    labels = {}
+    for label, b, count, sum_rt, mn, mx, blob in rows:
+        series = labels.get(label)
+        if series is None:
+            series = labels[label] = {"count": [0] * len(timestamps), "avg": [None] * len(timestamps),
+                                      "min": [None] * len(timestamps), "max": [None] * len(timestamps),
+                                      "p90": [None] * len(timestamps)}
+        i = (b - first) // width
+        series["count"][i] = count
+        series["avg"][i] = round(sum_rt / count, 2) if count else None
+        series["min"][i] = mn
+        series["max"][i] = mx
+        series["p90"][i] = hist_percentile(decode_counts(blob), 90)
+    return {"resolution": width, "timestamps": timestamps, "labels": labels}
 
 @app.route("/api/response_times", methods=["GET"])
+@conditional_get("default")
 def api_response_times():
     test_id = request.args.get("test_id", "default")
     start = request.args.get("start", type=int)
     end = request.args.get("end", type=int)
+    bucket = request.args.get("bucket")
+    if bucket:
+        # ?bucket=auto|N: bucketed series from the rollups instead of every raw sample
+        if not (start and end):
+            lo, hi = run_query(f"SELECT MIN(bucket), MAX(bucket) FROM {rollup_table(1)} WHERE test_id = ?",
+                               (test_id,))[0]
+            if lo is None:
+                return jsonify({"resolution": None, "timestamps": [], "labels": {}})
+            start, end = start or lo, end or hi
+        if bucket == "auto":
+            width = pick_resolution(start, end)
+        elif bucket.isdigit() and int(bucket) > 0:
+            width = int(bucket)
+        else:
+            return jsonify({"message": "bucket must be 'auto' or a number of seconds"}), 400
+        if (end - start) // width + 1 > RESPONSE_TIME_MAX_POINTS:
+            return jsonify({"message": f"bucket too small for this window (max {RESPONSE_TIME_MAX_POINTS} points)"}), 400
+        return jsonify(response_time_buckets(test_id, start, end, width))
+
+    compacted = []
+    if raw_compacted(test_id, start):
+        # before the retention horizon only rollups are left: one point per label
+        # and second, the average of that second's samples
+        horizon = raw_horizon(test_id)
+        conds = ["test_id = ?", "bucket < ?"]
+        params = [test_id, horizon]
+        if start:
+            conds.append("bucket >= ?")
+            params.append(start)
+        if end:
+            conds.append("bucket <= ?")
+            params.append(end)
+        compacted = run_query(f"""
+            SELECT label, bucket, ROUND(sum_rt / count, 2) FROM {rollup_table(1)}
+            WHERE {" AND ".join(conds)} ORDER BY bucket ASC
+        """, tuple(params))
+        start = horizon
+
     conds = ["test_id = ?"]
     params = [test_id]
-    if test_id:
-        conds.append("test_id = ?")
-        params.append(test_id)
     if start:
         conds.append("timestamp >= ?")
         params.append(start)
@@ -1556,11 +4389,11 @@ def api_response_times():
 
     q = f"""
         SELECT label, timestamp, response_time
-        FROM jmeter_samples
+        FROM {sample_source(test_id)}
         WHERE {where}
         ORDER BY timestamp ASC
     """
-    rows = run_query(q, tuple(params))
+    rows = compacted + run_query(q, tuple(params))
 
     # Group by label
     grouped = {}
@@ -1578,49 +4411,31 @@ def custom_query_database():
     query = data.get("query")
 
     try:
-        # Run the query
-        rows = run_query(query)
-
-        # Get column names
-        conn = sqlite3.connect(DB_FILE)   # change filename if needed
-        cur = conn.cursor()
-        cur.execute(query)
-        columns = [desc[0] for desc in cur.description] if cur.description else []
-        conn.close()
-
+        columns, rows = execute_query(query)
+        if not query.strip().upper().startswith("SELECT"):
+            with db_pool().writer() as conn:
+                with conn:
+                    bump_data_version(conn)  # arbitrary SQL may have changed any test
+            RESULT_CACHE.clear()
         return jsonify({"columns": columns, "rows": rows})
     except Exception as e:
         return jsonify({"error": str(e)})
 
 @app.route("/api/total_tps", methods=["GET"])
+@conditional_get(moving=True)
 def api_total_tps():
-    window = request.args.get("window", default=60, type=int)
-    end = request.args.get("end", type=int) or int(time.time())
-    start = end - window + 1
+    start, end, res, first = series_window()
     test_id = request.args.get("test_id")
+    rows = query_rollup("SUM(count), MAX(last_sec)", first, end, test_id, res=res)
 
-    if test_id:
-        rows = run_query(
-            "SELECT timestamp, COUNT(*) FROM jmeter_samples "
-            "WHERE timestamp BETWEEN ? AND ? AND test_id=? "
-            "GROUP BY timestamp ORDER BY timestamp ASC",
-            (start, end, test_id)
-        )
-    else:
-        rows = run_query(
-            "SELECT timestamp, COUNT(*) FROM jmeter_samples "
-            "WHERE timestamp BETWEEN ? AND ? "
-            "GROUP BY timestamp ORDER BY timestamp ASC",
-            (start, end)
-        )
-
-    ts_map = {r[0]: r[1] for r in rows}
+    ts_map = {r[0]: rate_per_second(r[1], res, bucket_seconds(r[0], r[2], res)) for r in rows}
     labels = []
     values = []
-    for sec in range(start, end + 1):
+    for sec in bucket_range(first, end, res):
         labels.append(sec)
         values.append(ts_map.get(sec, 0))
-    return jsonify({"timestamps": labels, "tps": values})
+    return jsonify({"timestamps": labels, "tps": values, "resolution": res,
+                    "cursor": series_cursor(end, res)})
 
 @app.route("/jmeter-dashboard.html")
 def jmeter_dashboard():
@@ -1405,43 +1405,29 @@ def api_label_tps():
     start = end - window + 1
     test_id = request.args.get("test_id")
 
+    # one GROUP BY label, timestamp pass pivoted into per-label arrays, instead of
+    # a DISTINCT label query plus one query per label on a thread pool
     if test_id:
-        label_rows = run_query(
-            "SELECT DISTINCT label FROM jmeter_samples WHERE timestamp BETWEEN ? AND ? AND test_id=?",
-            (start, end, test_id)
+        rows = run_query(
+            "SELECT label, timestamp, COUNT(*) FROM jmeter_samples "
+            "WHERE test_id=? AND timestamp BETWEEN ? AND ? "
+            "GROUP BY label, timestamp",
+            (test_id, start, end)
         )
     else:
-        label_rows = run_query(
-            "SELECT DISTINCT label FROM jmeter_samples WHERE timestamp BETWEEN ? AND ?",
+        rows = run_query(
+            "SELECT label, timestamp, COUNT(*) FROM jmeter_samples "
+            "WHERE timestamp BETWEEN ? AND ? "
+            "GROUP BY label, timestamp",
             (start, end)
         )
 
-    labels = [r[0] for r in label_rows]
     label_tps = {}
-
-    def get_label_tps(label):
-        if test_id:
-            rows = run_query(
-                "SELECT timestamp, COUNT(*) FROM jmeter_samples "
-                "WHERE timestamp BETWEEN ? AND ? AND label=? AND test_id=? "
-                "GROUP BY timestamp ORDER BY timestamp ASC",
-                (start, end, label, test_id)
-            )
-        else:
-            rows = run_query(
-                "SELECT timestamp, COUNT(*) FROM jmeter_samples "
-                "WHERE timestamp BETWEEN ? AND ? AND label=? "
-                "GROUP BY timestamp ORDER BY timestamp ASC",
-                (start, end, label)
-            )
-        ts_map = {r[0]: float(r[1]) for r in rows}
-        return (label, [round(ts_map.get(sec, 0.0), 2) for sec in range(start, end + 1)])
-
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        futures = [executor.submit(get_label_tps, label) for label in labels]
-        for f in futures:
-            label, tps_arr = f.result()
-            label_tps[label] = tps_arr
+    for label, sec, cnt in rows:
+        arr = label_tps.get(label)
+        if arr is None:
+            arr = label_tps[label] = [0.0] * (end - start + 1)
+        arr[sec - start] = float(cnt)
 
     timestamps = [sec for sec in range(start, end + 1)]
     return jsonify({"timestamps": timestamps, "label_tps": label_tps})
@@ -0,0 +1,27 @@
+import os, sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import server_final as sf
+
+
+@pytest.fixture(params=sf.SAMPLE_LAYOUTS)
+def layout(request):
+    return request.param
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch, layout):
+    # a fresh metrics database per test and sample layout; background workers follow DB_FILE
+    monkeypatch.setattr(sf, "SAMPLE_LAYOUT", layout)
+    monkeypatch.setattr(sf, "DB_FILE", str(tmp_path / "metrics.db"))
+    sf.init_db()
+    yield sf.app.test_client()
+    sf.INGEST.flush(timeout=10)
+    sf.db_pool().close()
+
+
+def sample(test_id, ts, **fields):
+    return dict({"label": "login", "timestamp": ts, "response_time": 100, "success": 1,
+                 "thread_count": 1, "test_id": test_id}, **fields)
@@ -0,0 +1,51 @@
+import time
+
+import pytest
+
+import server_final as sf
+from conftest import sample
+
+
+def ingest(client, samples):
+    assert client.post("/metrics/batch", json=samples).json["accepted"] == len(samples)
+    sf.INGEST.flush(timeout=10)
+
+
+def test_null_response_time_on_live_edge(client):
+    now = int(time.time())
+    samples = [sample("nulls", now - 5 + i % 5, response_time=10 + i) for i in range(20)]
+    samples.append(sample("nulls", now, response_time=None))
+    ingest(client, samples)
+    resp = client.get("/api/aggregate?test_id=nulls&percentiles=raw")
+    assert resp.status_code == 200
+    row, = resp.json
+    assert row["count"] == 21
+    assert row["avg"] == round(sum(range(10, 30)) / 20, 2)
+    assert row["min"] == 10 and row["max"] == 29
+
+
+@pytest.mark.parametrize("engine", ["python", "numpy"])
+def test_exact_matches_incremental_with_nulls(client, engine):
+    if engine == "numpy" and sf.np is None:
+        pytest.skip("numpy is not installed")
+    now = int(time.time())
+    samples = [sample("mixed", now - 9 + i % 10, response_time=(None if i % 7 == 0 else 5 + i))
+               for i in range(60)]
+    ingest(client, samples)
+    exact = sf.aggregate_exact("mixed", None, None, engine)
+    incremental = sf.AggregateState()
+    incremental.consume(sf.run_query(
+        "SELECT id, label, response_time, success, received_bytes, sent_bytes, timestamp "
+        f"FROM {sf.sample_source('mixed')} WHERE test_id = 'mixed' ORDER BY id"))
+    for a, b in zip(exact, incremental.result("mixed")):
+        assert {k: float(v) if isinstance(v, (int, float)) else v for k, v in a.items()} == \
+               {k: float(v) if isinstance(v, (int, float)) else v for k, v in b.items()}
+
+
+def test_failed_batch_leaves_state_and_watermark():
+    state = sf.AggregateState()
+    state.consume([(1, "a", 10.0, 1, 0, 0, 100)])
+    with pytest.raises(TypeError):
+        state.consume([(2, "a", 20.0, 1, 0, 0, 101), (3, "a", "bad", 1, 0, 0, 102)])
+    assert state.watermark == 1
+    assert state.result("t")[0]["count"] == 1
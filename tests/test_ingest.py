@@ -0,0 +1,32 @@
+import time
+
+import server_final as sf
+from conftest import sample
+
+
+def test_trickle_ingest_is_written_within_flush_interval(client):
+    # one sample per /metrics call, far below INGEST_BATCH_SIZE, as the JSR listener posts
+    now = int(time.time())
+    for i in range(50):
+        assert client.post("/metrics", json=sample("trickle", now + i % 5)).status_code == 200
+        if i == 10:
+            time.sleep(sf.INGEST_FLUSH_INTERVAL * 2)   # let a first group commit
+    deadline = time.monotonic() + sf.INGEST_FLUSH_INTERVAL * 4
+    count = 0
+    while time.monotonic() < deadline:
+        count = sf.run_query(f"SELECT COUNT(*) FROM {sf.sample_source('trickle')} "
+                             "WHERE test_id = 'trickle'")[0][0]
+        if count == 50:
+            break
+        time.sleep(0.05)
+    assert count == 50
+    assert sf.INGEST.depth() == 0
+
+
+def test_batch_larger_than_queue_is_413(client, monkeypatch):
+    monkeypatch.setattr(sf.INGEST, "maxsize", 10)
+    now = int(time.time())
+    resp = client.post("/metrics/batch", json=[sample("big", now)] * 11)
+    assert resp.status_code == 413
+    assert "Retry-After" not in resp.headers
+    assert client.post("/metrics/batch", json=[sample("big", now)] * 10).json["accepted"] == 10
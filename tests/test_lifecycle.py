@@ -0,0 +1,34 @@
+import time
+
+import server_final as sf
+from conftest import sample
+
+
+def summary_kinds(test_id):
+    return {r[0] for r in sf.run_query("SELECT kind FROM test_summaries WHERE test_id = ?", (test_id,))}
+
+
+def test_finalize_with_null_response_time(client):
+    now = int(time.time())
+    samples = [sample("fin", now - 3 + i % 3, response_time=20 + i) for i in range(10)]
+    samples.append(sample("fin", now, response_time=None))
+    client.post("/metrics/batch", json=samples)
+    resp = client.post("/api/finalize_testid", json={"test_id": "fin"})
+    assert resp.status_code == 200
+    assert resp.json["status"] == "finalized"
+    assert summary_kinds("fin") == {"aggregate:hist", "aggregate:raw", "errors", "success"}
+    raw, = client.get("/api/aggregate?test_id=fin&percentiles=raw").json
+    assert raw["count"] == 11
+    success, = client.get("/api/success?test_id=fin").json
+    assert success["count"] == 10
+
+
+def test_failing_summary_does_not_block_finalize(client, monkeypatch):
+    now = int(time.time())
+    client.post("/metrics/batch", json=[sample("partial", now, success=0, error_message="boom")])
+    def broken(*args):
+        raise RuntimeError("broken summary")
+    monkeypatch.setattr(sf, "errors_table", broken)
+    resp = client.post("/api/finalize_testid", json={"test_id": "partial"})
+    assert resp.status_code == 200
+    assert summary_kinds("partial") == {"aggregate:hist", "aggregate:raw", "success"}
@@ -0,0 +1,67 @@
+import time
+
+import pytest
+
+import server_final as sf
+from conftest import sample
+
+TESTS = 520   # past SQLite's 500-term limit on compound SELECTs
+
+
+@pytest.fixture
+def layout():
+    return "partitioned"
+
+
+def schema_names():
+    return {r[0] for r in sf.run_query("SELECT name FROM sqlite_master")}
+
+
+def test_more_than_500_tests(client):
+    now = int(time.time()) - 60
+    before = sf.INGEST.snapshot()["dropped"]
+    for lo in range(0, TESTS, 100):
+        batch = [sample(f"run{i}", now + j, response_time=10 + j) for i in range(lo, min(TESTS, lo + 100))
+                 for j in range(2)]
+        assert client.post("/metrics/batch", json=batch).json["accepted"] == len(batch)
+        sf.INGEST.flush(timeout=30)
+    assert sf.INGEST.snapshot()["dropped"] == before
+    names = schema_names()
+    assert "jmeter_samples" not in names and "sample_data" not in names
+    assert sum(name.startswith("sample_data_") for name in names) == TESTS
+    assert len(client.get("/api/testids").json) == TESTS
+
+    last = f"run{TESTS - 1}"
+    assert sf.sample_source(last) == sf.partition_view(sf.run_query(
+        "SELECT id FROM tests WHERE test_id = ?", (last,))[0][0])
+    row, = client.get(f"/api/aggregate?test_id={last}&percentiles=raw").json
+    assert (row["count"], row["min"], row["max"]) == (2, 10, 11)
+    assert client.get("/api/aggregate?test_id=missing&percentiles=raw").json == []
+
+    ref = sf.run_query("SELECT id FROM tests WHERE test_id = 'run0'")[0][0]
+    status_url = client.post("/api/delete_testid", json={"test_id": "run0"}).json["status_url"]
+    deadline = time.monotonic() + 30
+    while client.get(status_url).json["status"] != "done" and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert sf.partition_view(ref) not in schema_names()
+    assert len(client.get("/api/testids").json) == TESTS - 1
+
+    with sf.db_pool().writer() as conn:
+        sf.rebuild_catalog(conn)
+        sf.rebuild_rollups(conn)
+    assert len(client.get("/api/testids").json) == TESTS - 1
+    assert sf.run_query(f"SELECT SUM(count) FROM {sf.rollup_table(1)}")[0][0] == 2 * (TESTS - 1)
+
+
+def test_convert_to_rowid_and_back(client):
+    now = int(time.time()) - 60
+    client.post("/metrics/batch", json=[sample(f"c{i}", now + i) for i in range(5)] + [sample(None, now)])
+    sf.INGEST.flush(timeout=10)
+    for target in ("rowid", "partitioned"):
+        with sf.db_pool().writer() as conn:
+            assert sf.convert_sample_layout(conn, target)
+            assert sf.sample_layout(conn) == target
+        with sf.db_pool().reader() as conn:
+            assert sum(conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                       for table in sf.sample_tables(conn)) == 6
+        assert client.get("/api/aggregate?test_id=c3&percentiles=raw").json[0]["count"] == 1